@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Calculations provided by aiida_flexpart.
+Register calculations via the "aiida.calculations" entry point in setup.json.
+"""
+import yaml
+from aiida import orm, common, engine, plugins
+
+from ..utils import get_num_cores
+from .consolidate import group_by_site
+
+NetCDF = plugins.DataFactory('netcdf.data')
+
+
+class AggregateFootprintsCalculation(engine.CalcJob):
+    """AiiDA calculation plugin computing the mean, variance and maximum of the time-integrated
+    footprints per site and month. The code is expected to be a python interpreter with aiida-flexpart
+    installed, it runs :mod:`aiida_flexpart.footprints.aggregation` on the remote, one process per group."""
+    @classmethod
+    def define(cls, spec):
+        """Define inputs and outputs of the calculation."""
+        # yapf: disable
+        super().define(spec)
+
+        #INPUTS metadata
+        spec.inputs['metadata']['options']['resources'].default = {
+            'num_machines': 1,
+            'num_mpiprocs_per_machine': 1,
+        }
+        spec.input('metadata.options.max_wallclock_seconds', valid_type=int, default=1800)
+        spec.input('metadata.options.custom_scheduler_commands', valid_type=str, default='')
+        spec.input('metadata.options.withmpi', valid_type=bool, default=False)
+        spec.input('metadata.options.output_filename', valid_type=str, default='aiida.out', required=True)
+        spec.input('metadata.options.parser_name', valid_type=str, default='footprints.aggregate')
+
+        #Inputs
+        spec.input_namespace('remotes', valid_type = NetCDF, required=True,
+                             help = 'Dictionary of sensitivities as NetCDF objects, keyed by `<site>_...`')
+        spec.input('variable', valid_type = orm.Str, default = lambda: orm.Str('spec001_mr'),
+                   help = 'Footprint variable to aggregate')
+
+        spec.output('output_file', valid_type=orm.SinglefileData, required=True, help='Log of the aggregation')
+        spec.output_namespace('aggregates', valid_type=orm.ArrayData, required=True, dynamic=True,
+                              help='Mean, variance and maximum of the footprints per site and month (`<site>_<YYYYMM>`), '
+                                   'per site for the footprints whose month is unknown.')
+
+        #exit codes
+        spec.exit_code(300, 'ERROR_MISSING_OUTPUT_FILES', message='Calculation did not produce all expected output files.')
+
+    def prepare_for_submission(self, folder):
+
+        groups = group_by_site(self.inputs.remotes, by_month=True)
+        config = {
+            'groups': groups,
+            'variable': self.inputs.variable.value,
+            'max_workers': get_num_cores(self.inputs.metadata.options.resources),
+        }
+        with folder.open('aggregate.yaml', 'w') as f:
+            _ = yaml.dump(config, f)
+
+        codeinfo = common.CodeInfo()
+        codeinfo.cmdline_params = ['-m', 'aiida_flexpart.footprints.aggregation',
+                                   '-c', 'aggregate.yaml', '-o', 'aggregates.yaml']
+        codeinfo.code_uuid = self.inputs.code.uuid
+        codeinfo.stdout_name = self.metadata.options.output_filename
+        codeinfo.withmpi = self.inputs.metadata.options.withmpi
+
+        calcinfo = common.CalcInfo()
+        calcinfo.codes_info = [codeinfo]
+        # the statistics are small, one grid per age class
+        calcinfo.retrieve_list = ['aiida.out', 'aggregates.yaml'] + [f'{group}.nc' for group in groups]
+
+        return calcinfo
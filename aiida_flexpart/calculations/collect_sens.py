@@ -3,18 +3,59 @@
 Calculations provided by aiida_flexpart.
 Register calculations via the "aiida.calculations" entry point in setup.json.
 """
-from pathlib import Path
-from aiida import orm, common, engine
+import copy
+import functools
+import importlib.resources
+
 import yaml
-import importlib
+from aiida import orm, common, engine, plugins
+
+from ..utils import get_num_cores
+
+
+@functools.lru_cache(maxsize=None)
+def _load_default_params():
+    """Packaged defaults of `params.yaml`, parsed once and shared, never to be modified."""
+    return yaml.safe_load(importlib.resources.read_text('aiida_flexpart.templates', 'params.yaml'))
+
+
+def get_default_params():
+    """Packaged defaults of `params.yaml`, as a copy that the caller may modify."""
+    return copy.deepcopy(_load_default_params())
 
-with importlib.resources.path('aiida_flexpart.templates', "params.yaml") as p:
-    with open(p, 'r') as fp:
-        params_dict = yaml.safe_load(fp)
+
+NetCDF = plugins.DataFactory('netcdf.data')
 
 cosmo_models = ['cosmo7', 'cosmo1', 'kenda1']
 ECMWF_models = ['IFS_GL_05', 'IFS_GL_1', 'IFS_EU_02', 'IFS_EU_01']
 
+
+def make_params(paths, model, outgrid, outgrid_n, num_cores):
+    """Content of `params.yaml`, the packaged defaults updated with the inputs of a submission.
+
+    :param paths: dictionary mapping the keys of the stashed folders (`YYYY_MM_DD<site>`) to their path.
+    """
+    rel, path, days = [], [], []
+    for key, target_basepath in paths.items():
+        rel.append(key[10:])
+        path.append(target_basepath)
+        days.append(key[:10].replace('_', '-'))
+
+    params_dict = get_default_params()
+    params_dict.update({'rel.com': list(set(rel)),
+                        'path': path,
+                        'days': days,
+                        'bs.path': path,
+                        'domain.str': outgrid,
+                        'nest': outgrid_n,
+                        'nn.cores': num_cores,
+                        })
+    params_dict['globals'].update({
+        'met_model': model,
+        'model_version': 'FLEXPART ' + ('COSMO' if model in cosmo_models else 'IFS'),
+    })
+    return params_dict
+
 class CollectSensitivitiesCalculation(engine.CalcJob):
     """AiiDA calculation plugin for the collection of sensitivities.
        The main input are the stashed Netcdf files for the previous FLEXPART
@@ -31,7 +72,7 @@ class CollectSensitivitiesCalculation(engine.CalcJob):
         spec.input('metadata.options.custom_scheduler_commands', valid_type=str, default='')
         spec.input('metadata.options.withmpi', valid_type=bool, default=False)
         spec.input('metadata.options.output_filename', valid_type=str, default='aiida.out', required=True)
-        #spec.input('metadata.options.parser_name', valid_type=str, default='collect.sensitivities')
+        spec.input('metadata.options.parser_name', valid_type=str, default='collect.sensitivities')
 
         #Inputs
         spec.input_namespace('remote', valid_type=orm.RemoteStashFolderData, required=True)
@@ -44,6 +85,8 @@ class CollectSensitivitiesCalculation(engine.CalcJob):
 
         #exit codes
         spec.outputs.dynamic = True
+        spec.output_namespace('nc_files', valid_type=NetCDF, required=False, dynamic=True,
+                              help='Collected sensitivities keyed by site and month (`<site>_<YYYYMM>`).')
         spec.exit_code(300, 'ERROR_MISSING_OUTPUT_FILES', message='Calculation did not produce all expected output files.')
 
     def prepare_for_submission(self, folder):
@@ -54,30 +97,15 @@ class CollectSensitivitiesCalculation(engine.CalcJob):
         codeinfo.stdout_name = self.metadata.options.output_filename
         codeinfo.withmpi = self.inputs.metadata.options.withmpi
 
+        params_dict = make_params(
+            {key: remote.target_basepath for key, remote in self.inputs.remote.items()},
+            self.inputs.model,
+            self.inputs.outgrid,
+            self.inputs.outgrid_n,
+            get_num_cores(self.inputs.metadata.options.resources),
+        )
         with folder.open('params.yaml', 'w') as f:
-            rel,path,days =[],[],[]
-            for i,j in self.inputs.remote.items():
-                rel.append(i[10:])
-                path.append(j.target_basepath)
-                days.append(i[:10].replace('_', '-'))
-                
-            str_ = 'IFS'
-            if self.inputs.model in cosmo_models:
-                str_='COSMO'
-            
-            params_dict.update({'rel.com':list(set(rel)),
-                                'path':path,
-                                'days':days,
-                                'bs.path':path,
-                                'domain.str':self.inputs.outgrid,
-                                'nest':self.inputs.outgrid_n,
-                                    })
-            params_dict['globals'].update({
-                                        'met_model':self.inputs.model,
-                                        'model_version':'FLEXPART '+ str_
-                                        })
-            
-            _ = yaml.dump(params_dict, f)
+            yaml.dump(params_dict, f)
 
         if 'name' in self.inputs:
             self.node.base.extras.set(
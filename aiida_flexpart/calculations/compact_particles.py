@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Calculations provided by aiida_flexpart.
+Register calculations via the "aiida.calculations" entry point in setup.json.
+"""
+from aiida import orm, common, engine
+
+
+class CompactParticlesCalculation(engine.CalcJob):
+    """AiiDA calculation plugin compacting the particle dump of a FLEXPART run before an offline nested run.
+    The code is expected to be a python interpreter with aiida-flexpart installed,
+    it runs :mod:`aiida_flexpart.readers.partposit` on the remote. The working directory
+    holds the compacted `partposit_inst` and a link to the `header` of the parent run,
+    so that it can be used as `parent_calc_folder` of the next run."""
+    @classmethod
+    def define(cls, spec):
+        """Define inputs and outputs of the calculation."""
+        # yapf: disable
+        super().define(spec)
+
+        #INPUTS metadata
+        spec.inputs['metadata']['options']['resources'].default = {
+            'num_machines': 1,
+            'num_mpiprocs_per_machine': 1,
+        }
+        spec.input('metadata.options.max_wallclock_seconds', valid_type=int, default=1800)
+        spec.input('metadata.options.custom_scheduler_commands', valid_type=str, default='')
+        spec.input('metadata.options.withmpi', valid_type=bool, default=False)
+        spec.input('metadata.options.output_filename', valid_type=str, default='aiida.out', required=True)
+        spec.input('metadata.options.parser_name', valid_type=str, default='particles.compact')
+
+        #Inputs
+        spec.input('parent_calc_folder', valid_type = orm.RemoteData, required = True,
+                   help = 'Working directory of the run that dumped the particles')
+        spec.input('settings', valid_type = orm.Dict, required = False,
+                   help = 'Filters of the particles: `min_mass`, `max_age` (s), '
+                          '`region` [lon_min, lon_max, lat_min, lat_max] and `keep` (inside or outside)')
+
+        spec.output('compaction', valid_type=orm.Dict, required=True,
+                    help='Number of particles and size of the dump before and after the compaction.')
+
+        #exit codes
+        spec.exit_code(300, 'ERROR_MISSING_OUTPUT_FILES', message='Calculation did not produce all expected output files.')
+
+    def prepare_for_submission(self, folder):
+
+        settings = self.inputs.settings.get_dict() if 'settings' in self.inputs else {}
+        cmdline = ['-m', 'aiida_flexpart.readers.partposit', '-i', 'partposit_previous', '-o', 'partposit_inst']
+        if settings.get('min_mass') is not None:
+            cmdline += ['--min-mass', str(settings['min_mass'])]
+        if settings.get('max_age') is not None:
+            cmdline += ['--max-age', str(int(settings['max_age']))]
+        if settings.get('region') is not None:
+            cmdline += ['--region'] + [str(value) for value in settings['region']]
+        if settings.get('keep') is not None:
+            cmdline += ['--keep', settings['keep']]
+
+        codeinfo = common.CodeInfo()
+        codeinfo.cmdline_params = cmdline
+        codeinfo.code_uuid = self.inputs.code.uuid
+        codeinfo.stdout_name = self.metadata.options.output_filename
+        codeinfo.withmpi = self.inputs.metadata.options.withmpi
+
+        computer_uuid = self.inputs.parent_calc_folder.computer.uuid
+        remote_path = self.inputs.parent_calc_folder.get_remote_path()
+
+        calcinfo = common.CalcInfo()
+        calcinfo.codes_info = [codeinfo]
+        calcinfo.remote_symlink_list = [
+            (computer_uuid, remote_path + '/header', 'header'),
+            (computer_uuid, remote_path + '/partposit_inst', 'partposit_previous'),
+        ]
+        calcinfo.retrieve_list = ['compaction.yaml', 'aiida.out']
+
+        return calcinfo
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Calculations provided by aiida_flexpart.
+Register calculations via the "aiida.calculations" entry point in setup.json.
+"""
+import re
+
+from aiida import orm, common, engine, plugins
+
+from ..utils import get_nc_header_probe, NC_HEADERS_FILENAME
+
+NetCDF = plugins.DataFactory('netcdf.data')
+
+
+def get_month(node):
+    """Month (YYYYMM) of a footprint, from its `month` attribute or from its file name."""
+    month = node.base.attributes.get('month', None)
+    # consolidated products of earlier versions stored an unknown month as 'None'
+    if month in (None, 'None'):
+        match = re.search(r'(\d{4})[-_]?(\d{2})', node.base.attributes.get('filename', ''))
+        month = ''.join(match.groups()) if match else None
+    return month
+
+
+def group_by_site(remotes, by_month=False):
+    """
+    Group the remote paths of the footprints by site, the keys of `remotes` start with `<site>_`.
+
+    With `by_month`, the footprints are grouped by site and month and the groups are keyed by `<site>_<YYYYMM>`,
+    the footprints whose month is unknown are grouped by site only.
+    """
+    groups = {}
+    for key, value in remotes.items():
+        group = key.split('_')[0]
+        month = get_month(value) if by_month else None
+        if month is not None:
+            group = f'{group}_{month}'
+        groups.setdefault(group, []).append(value.get_remote_path())
+    return {group: sorted(paths) for group, paths in groups.items()}
+
+
+class ConsolidateFootprintsCalculation(engine.CalcJob):
+    """AiiDA calculation plugin concatenating the footprints of each site along the
+    time dimension into a single chunked and compressed NetCDF file.
+    The code is expected to be the NCO `ncrcat` executable."""
+    @classmethod
+    def define(cls, spec):
+        """Define inputs and outputs of the calculation."""
+        # yapf: disable
+        super().define(spec)
+
+        #INPUTS metadata
+        spec.inputs['metadata']['options']['resources'].default = {
+            'num_machines': 1,
+            'num_mpiprocs_per_machine': 1,
+        }
+        spec.input('metadata.options.max_wallclock_seconds', valid_type=int, default=1800)
+        spec.input('metadata.options.custom_scheduler_commands', valid_type=str, default='')
+        spec.input('metadata.options.withmpi', valid_type=bool, default=False)
+        spec.input('metadata.options.parser_name', valid_type=str, default='footprints.consolidate')
+
+        #Inputs
+        spec.input_namespace('remotes', valid_type = NetCDF, required=True,
+                             help = 'Dictionary of sensitivities as NetCDF objects, keyed by `<site>_...`')
+        spec.input('compression_level', valid_type = orm.Int, default = lambda: orm.Int(4),
+                   help = 'Deflate level of the consolidated files')
+        spec.input('by_month', valid_type = orm.Bool, default = lambda: orm.Bool(False),
+                   help = 'Consolidate the footprints by site and month instead of by site only')
+        spec.input('time_chunk', valid_type = orm.Int, default = lambda: orm.Int(1),
+                   help = 'Chunk size along the time dimension of the consolidated files')
+
+        spec.output_namespace('consolidated', valid_type=NetCDF, required=True, dynamic=True,
+                              help='One consolidated footprint file per site, or per site and month (`<site>_<YYYYMM>`).')
+
+        #exit codes
+        spec.exit_code(300, 'ERROR_MISSING_OUTPUT_FILES', message='Calculation did not produce all expected output files.')
+
+    def prepare_for_submission(self, folder):
+
+        # one ncrcat call per site, the (possibly many) input files are read from stdin
+        codes_info = []
+        for site, paths in group_by_site(self.inputs.remotes, self.inputs.by_month.value).items():
+            with folder.open(f'{site}_footprints.txt', 'w') as f:
+                f.write('\n'.join(paths) + '\n')
+
+            codeinfo = common.CodeInfo()
+            codeinfo.cmdline_params = [
+                '-O', '-4',
+                '-L', str(self.inputs.compression_level.value),
+                '--cnk_dmn', f'time,{self.inputs.time_chunk.value}',
+                '-o', f'{site}.nc',
+            ]
+            codeinfo.code_uuid = self.inputs.code.uuid
+            codeinfo.stdin_name = f'{site}_footprints.txt'
+            codeinfo.stdout_name = f'{site}.log'
+            codeinfo.join_files = True
+            codeinfo.withmpi = self.inputs.metadata.options.withmpi
+            codes_info.append(codeinfo)
+
+        calcinfo = common.CalcInfo()
+        calcinfo.codes_info = codes_info
+        calcinfo.append_text = get_nc_header_probe('*.nc', NC_HEADERS_FILENAME)
+        calcinfo.retrieve_list = [NC_HEADERS_FILENAME, '*.log']
+
+        return calcinfo
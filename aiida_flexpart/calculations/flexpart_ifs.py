@@ -10,8 +10,10 @@ import datetime
 import pathlib
 import jinja2
 
-from aiida import common, orm, engine
-from ..utils import fill_in_template_file
+from aiida import common, orm, engine, plugins
+from ..utils import fill_in_template_file, get_nc_output_commands, validate_log_storage
+
+NetCDF = plugins.DataFactory('netcdf.data')
 
 
 class FlexpartIfsCalculation(engine.CalcJob):
@@ -31,6 +33,17 @@ class FlexpartIfsCalculation(engine.CalcJob):
         spec.input('metadata.options.max_wallclock_seconds', valid_type=int, default=1800)
         spec.input('metadata.options.custom_scheduler_commands', valid_type=str, default='')
         spec.input('metadata.options.withmpi', valid_type=bool, default=False)
+        spec.input('metadata.options.retrieve_nc_files', valid_type=bool, default=True,
+            help='If False, the `grid_time_*.nc` files are left on the remote and only their headers are retrieved.')
+        spec.input('metadata.options.binary_converter', valid_type=str, default='',
+            help='Python interpreter (with aiida-flexpart) used to convert the native binary output to NetCDF '
+            'at the end of the job, for runs without NetCDF output. Empty if FLEXPART writes NetCDF.')
+        spec.input('metadata.options.log_storage', valid_type=str, default='full', validator=validate_log_storage,
+            help="How to store the log of successful runs: 'full', 'gzip' (compressed) or 'tail' (last `log_tail_kb`).")
+        spec.input('metadata.options.log_tail_kb', valid_type=int, default=64,
+            help="Size of the log tail that is stored with `log_storage='tail'`.")
+        spec.input('metadata.options.log_full_size_kb', valid_type=int, default=1024,
+            help='Logs up to this size are always stored in full, as are the logs of failed runs.')
         spec.input('metadata.options.parser_name', valid_type=str, default='flexpart.ifs')
 
         spec.input(
@@ -51,12 +64,23 @@ class FlexpartIfsCalculation(engine.CalcJob):
             help='Input file for the Lagrangian particle dispersion model FLEXPART. Nested output grid.'
             )
         spec.input('species', valid_type=orm.RemoteData, required=True)
+        spec.input('nc_subset', valid_type=orm.Dict, required=False,
+            help='Variables (`variables`) and output time indices (`time`: [start, end] or [start, end, stride], '
+            'passed to `ncks -d time,start,end`, both ends included) of the `grid_time_*.nc` files to retrieve. '
+            'The files are reduced on the remote at the end of the job, only the reduced copies (or their headers '
+            'without `retrieve_nc_files`) are retrieved.')
         spec.input_namespace('land_use', valid_type=orm.RemoteData, required=False, dynamic=True, help='#TODO')
 
         spec.input('meteo_path', valid_type=orm.List,
         required=True, help='Path to the folder containing the meteorological input data.')
         spec.input('metadata.options.output_filename', valid_type=str, default='aiida.out', required=True)
         spec.outputs.dynamic = True
+        spec.output_namespace('nc_files', valid_type=NetCDF, required=False, dynamic=True,
+            help='`grid_time_*.nc` output files, with dimensions and global attributes read from their headers.')
+        spec.output('performance', valid_type=orm.Dict, required=False,
+            help='Timesteps, particle counts, wall-clock per simulated hour and warnings parsed from the log.')
+        spec.output('header', valid_type=orm.Dict, required=False,
+            help='Output grid, species, release points and timing read from the binary `header` file.')
 
         #exit codes
         spec.exit_code(300, 'ERROR_MISSING_OUTPUT_FILES', message='Calculation did not produce all expected output files.')
@@ -178,6 +202,10 @@ class FlexpartIfsCalculation(engine.CalcJob):
             file_path = value.get_remote_path()
             calcinfo.remote_symlink_list.append((value.computer.uuid, file_path, pathlib.Path(file_path).name))
 
-        calcinfo.retrieve_list = ['grid_time_*.nc', 'aiida.out']
+        nc_subset = self.inputs.nc_subset.get_dict() if 'nc_subset' in self.inputs else None
+        calcinfo.append_text, calcinfo.retrieve_list = get_nc_output_commands(self.inputs.metadata.options, nc_subset)
+
+        # only parsed into the `header` output, not stored
+        calcinfo.retrieve_temporary_list = ['header']
 
         return calcinfo
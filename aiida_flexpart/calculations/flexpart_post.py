@@ -5,6 +5,8 @@ Register calculations via the "aiida.calculations" entry point in setup.json.
 """
 from aiida import orm, common, engine
 
+from ..utils import get_nc_subset_command, NC_SUBSET_FOLDER
+
 
 class PostProcessingCalculation(engine.CalcJob):
     """AiiDA calculation plugin for post processing."""
@@ -28,6 +30,9 @@ class PostProcessingCalculation(engine.CalcJob):
                    help = 'main FLEXPART output dir')
         spec.input('input_offline_dir', valid_type = orm.RemoteData, required=False,
                    help = 'offline-nested FLEXPART output dir')
+        spec.input('nc_subset', valid_type = orm.Dict, required=False,
+                   help = 'Variables (`variables`) and output time indices (`time`) of the NetCDF files to retrieve. '
+                   'The files are reduced on the remote at the end of the job, only the reduced copies are retrieved.')
         spec.input('metadata.options.output_filename', valid_type=str, default='aiida.out', required=True)
         #exit codes
         spec.outputs.dynamic = True
@@ -50,6 +55,10 @@ class PostProcessingCalculation(engine.CalcJob):
         # Prepare a `CalcInfo` to be returned to the engine
         calcinfo = common.CalcInfo()
         calcinfo.codes_info = [codeinfo]
-        calcinfo.retrieve_list = ['grid_time_*.nc', 'boundary_sensitivity_*.nc','*.png', 'aiida.out']
+        nc_patterns = ['grid_time_*.nc', 'boundary_sensitivity_*.nc']
+        if 'nc_subset' in self.inputs:
+            calcinfo.append_text = get_nc_subset_command(nc_patterns, self.inputs.nc_subset.get_dict())
+            nc_patterns = [f'{NC_SUBSET_FOLDER}/{pattern}' for pattern in nc_patterns]
+        calcinfo.retrieve_list = nc_patterns + ['*.png', 'aiida.out']
 
         return calcinfo
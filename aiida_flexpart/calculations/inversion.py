@@ -31,6 +31,10 @@ class Inversion(engine.CalcJob):
         spec.input_namespace('observations', valid_type = NetCDF, required=True,
                              help = 'Dictionary of observations as NetCDF objects')
 
+        spec.input_namespace('jacobians', valid_type = orm.RemoteData, required=False,
+                             help = 'Dictionary of pre-assembled Jacobians (.npy) keyed by site (h.fl)')
+        spec.input('prior',valid_type = orm.FolderData, required = False,
+                   help = 'Retrieved folder of a previous inversion chunk, its ELRIS files are used as prior (prior.fls)')
         spec.input('inv_params',valid_type = orm.Dict, required = True,
                    help = 'File containing inversion settings, either as R source file or yaml')
         spec.input('start_date',valid_type = orm.Str, required = True,
@@ -48,6 +52,9 @@ class Inversion(engine.CalcJob):
 
         #exit codes
         spec.outputs.dynamic = True
+        spec.output_namespace('elris', valid_type=orm.ArrayData, required=False, dynamic=True,
+                              help='Variables of the retrieved ELRIS NetCDF files, one ArrayData per file')
+        spec.exit_code(300, 'ERROR_MISSING_OUTPUT_FILES', message='Calculation did not produce all expected output files.')
 
     def prepare_for_submission(self, folder):
 
@@ -81,6 +88,25 @@ class Inversion(engine.CalcJob):
         for k,v in remote_dict.items():
             params_dict['sites'][k].update({'ft.fls':v})
 
+        #pre-assembled Jacobians
+        for k,v in self.inputs.get('jacobians', {}).items():
+            params_dict['sites'][k].update({'h.fl':v.get_remote_path()})
+
+        #observations sliced to the window of the chunk replace the full files
+        for k,v in self.inputs.observations.items():
+            if 'dtm_start' in v.base.attributes.keys() and k.split("_")[0] in params_dict['sites']:
+                params_dict['sites'][k.split("_")[0]].setdefault('obs.fls', []).append(v.get_remote_path())
+
+        #warm start from the posterior of a previous chunk
+        local_copy_list = []
+        if 'prior' in self.inputs:
+            prior_fls = []
+            for name in self.inputs.prior.base.repository.list_object_names():
+                if name.startswith('ELRIS'):
+                    local_copy_list.append((self.inputs.prior.uuid, name, f'prior/{name}'))
+                    prior_fls.append(f'prior/{name}')
+            params_dict['prior_fls'] = prior_fls
+
         #replace _ by . in dict
         params_dict = {
     key.replace("_", "."): value for key, value in params_dict.items()
@@ -91,6 +117,7 @@ class Inversion(engine.CalcJob):
             
         calcinfo = common.CalcInfo()
         calcinfo.codes_info = [codeinfo]
+        calcinfo.local_copy_list = local_copy_list
         calcinfo.retrieve_list = ['aiida.out',
                                   params_dict['run.str']+'*/iterative/*/data/ELRIS*'
                                   ]
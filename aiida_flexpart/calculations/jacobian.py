@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Calculations provided by aiida_flexpart.
+Register calculations via the "aiida.calculations" entry point in setup.json.
+"""
+import yaml
+from scipy import sparse
+from aiida import orm, common, engine, plugins
+
+from ..footprints.jacobian import region_weights
+from ..utils import get_num_cores
+from .consolidate import group_by_site
+
+NetCDF = plugins.DataFactory('netcdf.data')
+
+
+class JacobianCalculation(engine.CalcJob):
+    """AiiDA calculation plugin assembling the Jacobian (H matrix) of each site from its footprints.
+    The code is expected to be a python interpreter with aiida-flexpart installed,
+    it runs :mod:`aiida_flexpart.footprints.jacobian` on the remote."""
+    @classmethod
+    def define(cls, spec):
+        """Define inputs and outputs of the calculation."""
+        # yapf: disable
+        super().define(spec)
+
+        #INPUTS metadata
+        spec.inputs['metadata']['options']['resources'].default = {
+            'num_machines': 1,
+            'num_mpiprocs_per_machine': 1,
+        }
+        spec.input('metadata.options.max_wallclock_seconds', valid_type=int, default=1800)
+        spec.input('metadata.options.custom_scheduler_commands', valid_type=str, default='')
+        spec.input('metadata.options.withmpi', valid_type=bool, default=False)
+        spec.input('metadata.options.output_filename', valid_type=str, default='aiida.out', required=True)
+        spec.input('metadata.options.parser_name', valid_type=str, default='jacobian.assemble')
+
+        #Inputs
+        spec.input_namespace('remotes', valid_type = NetCDF, required=True,
+                             help = 'Dictionary of sensitivities as NetCDF objects, keyed by `<site>_...`')
+        spec.input('region_mask', valid_type = orm.ArrayData, required = True,
+                   help = "Array 'mask' with the region index of each grid cell (negative outside of the regions)"
+                          " and optionally the array 'area' with the weight of each cell")
+        spec.input('settings', valid_type = orm.Dict, required = False,
+                   help = "Footprint 'variable', 'height' and 'ageclass' indices")
+
+        spec.output('output_file', valid_type=orm.SinglefileData, required=True, help='Log of the assembly')
+        spec.output_namespace('jacobians', valid_type=orm.RemoteData, required=True, dynamic=True,
+                              help='Memory-mapped Jacobian (.npy) of each site')
+
+        #exit codes
+        spec.exit_code(300, 'ERROR_MISSING_OUTPUT_FILES', message='Calculation did not produce all expected output files.')
+
+    def prepare_for_submission(self, folder):
+
+        region_mask = self.inputs.region_mask
+        area = None
+        if 'area' in region_mask.get_arraynames():
+            area = region_mask.get_array('area')
+        with folder.open('weights.npz', 'wb') as handle:
+            sparse.save_npz(handle, region_weights(region_mask.get_array('mask'), area))
+
+        config = {
+            'sites': group_by_site(self.inputs.remotes),
+            'weights': 'weights.npz',
+            'max_workers': get_num_cores(self.inputs.metadata.options.resources),
+        }
+        if 'settings' in self.inputs:
+            config.update(self.inputs.settings.get_dict())
+        with folder.open('jacobian.yaml', 'w') as f:
+            _ = yaml.dump(config, f)
+
+        codeinfo = common.CodeInfo()
+        codeinfo.cmdline_params = ['-m', 'aiida_flexpart.footprints.jacobian',
+                                   '-c', 'jacobian.yaml', '-o', 'jacobians.yaml']
+        codeinfo.code_uuid = self.inputs.code.uuid
+        codeinfo.stdout_name = self.metadata.options.output_filename
+        codeinfo.withmpi = self.inputs.metadata.options.withmpi
+
+        calcinfo = common.CalcInfo()
+        calcinfo.codes_info = [codeinfo]
+        calcinfo.retrieve_list = ['aiida.out', 'jacobians.yaml']
+
+        return calcinfo
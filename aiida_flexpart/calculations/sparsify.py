@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Calculations provided by aiida_flexpart.
+Register calculations via the "aiida.calculations" entry point in setup.json.
+"""
+import yaml
+from aiida import orm, common, engine, plugins
+
+from ..utils import get_nc_header_probe, NC_HEADERS_FILENAME
+
+NetCDF = plugins.DataFactory('netcdf.data')
+
+
+class SparsifyFootprintsCalculation(engine.CalcJob):
+    """AiiDA calculation plugin storing the footprints of NetCDF files in sparse format.
+    The code is expected to be a python interpreter with aiida-flexpart installed,
+    it runs :mod:`aiida_flexpart.footprints.sparsify` on the remote."""
+    @classmethod
+    def define(cls, spec):
+        """Define inputs and outputs of the calculation."""
+        # yapf: disable
+        super().define(spec)
+
+        #INPUTS metadata
+        spec.inputs['metadata']['options']['resources'].default = {
+            'num_machines': 1,
+            'num_mpiprocs_per_machine': 1,
+        }
+        spec.input('metadata.options.max_wallclock_seconds', valid_type=int, default=1800)
+        spec.input('metadata.options.custom_scheduler_commands', valid_type=str, default='')
+        spec.input('metadata.options.withmpi', valid_type=bool, default=False)
+        spec.input('metadata.options.output_filename', valid_type=str, default='aiida.out', required=True)
+        spec.input('metadata.options.parser_name', valid_type=str, default='footprints.sparsify')
+
+        #Inputs
+        spec.input_namespace('remotes', valid_type = NetCDF, required=True,
+                             help = 'Dictionary of dense footprint files as NetCDF objects')
+        spec.input('variables', valid_type = orm.List, required = False,
+                   help = 'Variables to store sparse, by default all the footprint variables')
+        spec.input('threshold', valid_type = orm.Float, default = lambda: orm.Float(0.),
+                   help = 'Values whose magnitude does not exceed the threshold are dropped, 0 is lossless')
+        spec.input('compression_level', valid_type = orm.Int, default = lambda: orm.Int(4),
+                   help = 'Deflate level of the sparse arrays')
+
+        spec.output_namespace('nc_files', valid_type=NetCDF, required=True, dynamic=True,
+                              help='Sparse copies of the footprint files, with the same keys as `remotes`.')
+
+        #exit codes
+        spec.exit_code(300, 'ERROR_MISSING_OUTPUT_FILES', message='Calculation did not produce all expected output files.')
+
+    def prepare_for_submission(self, folder):
+
+        config = {
+            'files': {f'{key}.nc': value.get_remote_path() for key, value in self.inputs.remotes.items()},
+            'threshold': self.inputs.threshold.value,
+            'compression_level': self.inputs.compression_level.value,
+        }
+        if 'variables' in self.inputs:
+            config['variables'] = self.inputs.variables.get_list()
+        with folder.open('sparsify.yaml', 'w') as f:
+            _ = yaml.dump(config, f)
+
+        codeinfo = common.CodeInfo()
+        codeinfo.cmdline_params = ['-m', 'aiida_flexpart.footprints.sparsify', '-c', 'sparsify.yaml']
+        codeinfo.code_uuid = self.inputs.code.uuid
+        codeinfo.stdout_name = self.metadata.options.output_filename
+        codeinfo.withmpi = self.inputs.metadata.options.withmpi
+
+        calcinfo = common.CalcInfo()
+        calcinfo.codes_info = [codeinfo]
+        calcinfo.append_text = get_nc_header_probe('*.nc', NC_HEADERS_FILENAME)
+        calcinfo.retrieve_list = [NC_HEADERS_FILENAME, 'aiida.out']
+
+        return calcinfo
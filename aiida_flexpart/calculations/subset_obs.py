@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Calculations provided by aiida_flexpart.
+Register calculations via the "aiida.calculations" entry point in setup.json.
+"""
+from aiida import orm, common, engine, plugins
+
+from ..utils import get_nc_header_probe, NC_HEADERS_FILENAME
+
+NetCDF = plugins.DataFactory('netcdf.data')
+
+
+class SubsetObservationsCalculation(engine.CalcJob):
+    """AiiDA calculation plugin slicing observation files to the time window of an
+    inversion chunk. The code is expected to be the NCO `ncks` executable."""
+    @classmethod
+    def define(cls, spec):
+        """Define inputs and outputs of the calculation."""
+        # yapf: disable
+        super().define(spec)
+
+        #INPUTS metadata
+        spec.inputs['metadata']['options']['resources'].default = {
+            'num_machines': 1,
+            'num_mpiprocs_per_machine': 1,
+        }
+        spec.input('metadata.options.max_wallclock_seconds', valid_type=int, default=1800)
+        spec.input('metadata.options.custom_scheduler_commands', valid_type=str, default='')
+        spec.input('metadata.options.withmpi', valid_type=bool, default=False)
+        spec.input('metadata.options.parser_name', valid_type=str, default='observations.subset')
+
+        #Inputs
+        spec.input_namespace('observations', valid_type = NetCDF, required=True,
+                             help = 'Dictionary of observations as NetCDF objects')
+        spec.input('dtm_start',valid_type = orm.Str, required = True,
+                   help = 'Start of the window (yyyy-mm-dd)')
+        spec.input('dtm_end',valid_type = orm.Str, required = True,
+                   help = 'End of the window (yyyy-mm-dd)')
+
+        spec.output_namespace('observations', valid_type=NetCDF, required=True, dynamic=True,
+                              help='Observations restricted to the window, with the same keys as the inputs.')
+
+        #exit codes
+        spec.exit_code(300, 'ERROR_MISSING_OUTPUT_FILES', message='Calculation did not produce all expected output files.')
+
+    def prepare_for_submission(self, folder):
+
+        # one ncks call per observation file
+        codes_info = []
+        for key, value in self.inputs.observations.items():
+            codeinfo = common.CodeInfo()
+            codeinfo.cmdline_params = [
+                '-O',
+                '-d', f'time,{self.inputs.dtm_start.value},{self.inputs.dtm_end.value}',
+                value.get_remote_path(),
+                f'{key}.nc',
+            ]
+            codeinfo.code_uuid = self.inputs.code.uuid
+            codeinfo.stdout_name = f'{key}.log'
+            codeinfo.join_files = True
+            codeinfo.withmpi = self.inputs.metadata.options.withmpi
+            codes_info.append(codeinfo)
+
+        calcinfo = common.CalcInfo()
+        calcinfo.codes_info = codes_info
+        calcinfo.append_text = get_nc_header_probe('*.nc', NC_HEADERS_FILENAME)
+        calcinfo.retrieve_list = [NC_HEADERS_FILENAME, '*.log']
+
+        return calcinfo
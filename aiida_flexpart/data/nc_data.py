@@ -1,6 +1,9 @@
 import os
+import tempfile
 from aiida.orm import RemoteData
 
+from ..footprints import sparsify
+
 
 class NetCdfData(RemoteData):
 
@@ -42,3 +45,31 @@ class NetCdfData(RemoteData):
         print("// global attributes:")
         for k, v in self.base.attributes.get("global_attributes").items():
             print(f"\t :{k} = {v}")
+
+    @property
+    def is_sparse(self):
+        """Whether footprints of the file are stored sparse, see :mod:`aiida_flexpart.footprints.sparsify`."""
+        return 'sparse_variables' in (self.base.attributes.get("global_attributes") or {})
+
+    def get_variable(self, name, time=None):
+        """Copy the file from the remote and read the variable `name` as a dense array.
+
+        Sparse footprints are returned dense, so that both storage formats are read alike.
+
+        :param time: optional output time index, only this output time is read.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            local_path = os.path.join(tmpdir, self.base.attributes.get("filename"))
+            self.download(local_path)
+            return sparsify.read_variable(local_path, name, time)
+
+    def download(self, local_path, transport=None):
+        """Copy the file from the remote to `local_path`.
+
+        :param transport: optional open transport to the computer, e.g. to copy several files through one connection.
+        """
+        if transport is not None:
+            transport.getfile(self.get_remote_path(), str(local_path))
+            return
+        with self.get_authinfo().get_transport() as transport:
+            transport.getfile(self.get_remote_path(), str(local_path))
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""Processing of FLEXPART footprints, the modules can also be run on the remote."""
+import multiprocessing
+from concurrent import futures
+
+
+def process_pool(max_workers=None):
+    """Pool of `max_workers` processes for the work on netCDF files.
+
+    The netCDF library is not thread safe, hence separate processes, which are spawned
+    rather than forked so that they do not inherit its state from the parent.
+    """
+    return futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming aggregation of FLEXPART footprints, e.g. per site and month.
+
+The samples are the time-integrated footprints of the release points. They are
+built one output time at a time and their mean, variance and maximum are updated
+with Welford's online algorithm in double precision, so that the memory use
+does not depend on the number of files (days) aggregated. Dense and sparse (see
+:mod:`aiida_flexpart.footprints.sparsify`) files are read alike.
+
+The module can be run on the remote, see :func:`main`.
+"""
+import argparse
+import pathlib
+
+import numpy
+import netCDF4
+import yaml
+
+from . import process_pool
+from .sparsify import get_time_slice
+
+COORDINATES = ('height', 'latitude', 'longitude')
+
+
+class RunningStats:
+    """Running count, mean, variance and maximum of arrays of a fixed shape (Welford)."""
+
+    def __init__(self, shape):
+        self.count = 0
+        self.mean = numpy.zeros(shape)
+        self.m2 = numpy.zeros(shape)
+        self.max = numpy.full(shape, -numpy.inf)
+
+    def update(self, sample):
+        """Add one sample."""
+        self.count += 1
+        delta = sample - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (sample - self.mean)
+        numpy.maximum(self.max, sample, out=self.max)
+
+    def merge(self, other):
+        """Add the samples accumulated by another instance (Chan et al.)."""
+        count = self.count + other.count
+        if other.count:
+            delta = other.mean - self.mean
+            self.mean += delta * other.count / count
+            self.m2 += other.m2 + delta**2 * self.count * other.count / count
+            numpy.maximum(self.max, other.max, out=self.max)
+            self.count = count
+
+    @property
+    def variance(self):
+        """Sample variance, zero for less than two samples."""
+        if self.count < 2:
+            return numpy.zeros_like(self.m2)
+        return self.m2 / (self.count - 1)
+
+
+def integrated_footprints(path, variable='spec001_mr'):
+    """Footprints of the release points of a file, integrated over the output times.
+
+    :return: array (pointspec, nageclass, height, latitude, longitude).
+    """
+    with netCDF4.Dataset(str(path), mode='r') as nc_file:
+        total = None
+        for time in range(len(nc_file.dimensions['time'])):
+            footprint = get_time_slice(nc_file, variable, time)
+            if total is None:
+                total = numpy.zeros(footprint.shape)
+            total += footprint
+    # releases first, each of them is a sample
+    return numpy.moveaxis(total, 1, 0)
+
+
+def aggregate(paths, variable='spec001_mr'):
+    """Statistics of the time-integrated footprints of all the release points of the files."""
+    stats = None
+    for path in paths:
+        stats = aggregate_file(path, stats, variable)
+    if stats is None:
+        raise ValueError(f'no footprints to aggregate in {len(paths)} file(s)')
+    return stats
+
+
+def aggregate_file(path, stats=None, variable='spec001_mr'):
+    """Add the time-integrated footprints of the release points of a file to `stats`.
+
+    :param stats: statistics of the files aggregated so far, created from the first footprint when None.
+    :return: the updated statistics, None if there were none and the file has no release points.
+    """
+    for footprint in integrated_footprints(path, variable):
+        if stats is None:
+            stats = RunningStats(footprint.shape)
+        stats.update(footprint)
+    return stats
+
+
+def write_stats(stats, out_path, template_path, variable='spec001_mr'):
+    """Write the mean, variance and maximum to a NetCDF file, the coordinates are copied from `template_path`."""
+    with netCDF4.Dataset(str(template_path), mode='r') as template, \
+            netCDF4.Dataset(str(out_path), mode='w', format='NETCDF4') as nc_file:
+        nc_file.setncattr('n_samples', stats.count)
+        nc_file.createDimension('nageclass', stats.mean.shape[0])
+        for name in COORDINATES:
+            nc_file.createDimension(name, len(template.dimensions[name]))
+            if name in template.variables:
+                coordinate = nc_file.createVariable(name, template.variables[name].dtype, (name,))
+                coordinate.setncatts({k: template.variables[name].getncattr(k)
+                                      for k in template.variables[name].ncattrs() if k != '_FillValue'})
+                coordinate[:] = template.variables[name][:]
+        units = getattr(template.variables[variable], 'units', None)
+        for suffix, values in (('mean', stats.mean), ('variance', stats.variance), ('max', stats.max)):
+            nc_variable = nc_file.createVariable(f'{variable}_{suffix}', 'f4', ('nageclass',) + COORDINATES,
+                                                 zlib=True, complevel=4)
+            if units:
+                nc_variable.units = units if suffix != 'variance' else f'({units})2'
+            nc_variable[:] = values
+
+
+def aggregate_to_file(paths, out_path, variable='spec001_mr'):
+    """Aggregate the files and write the statistics, return the number of samples."""
+    stats = aggregate(paths, variable)
+    write_stats(stats, out_path, paths[0], variable)
+    return stats.count
+
+
+def aggregate_groups(groups, out_dir='.', max_workers=None, variable='spec001_mr'):
+    """Aggregate several groups of files (e.g. sites and months) in parallel, one process per group.
+
+    :param groups: dictionary mapping the groups to their footprint files.
+    :return: dictionary mapping the groups to the path of their statistics and their number of samples.
+    """
+    out_dir = pathlib.Path(out_dir)
+    with process_pool(max_workers) as executor:
+        jobs = {
+            group: executor.submit(aggregate_to_file, sorted(paths), out_dir / f'{group}.nc', variable)
+            for group, paths in groups.items()
+        }
+        return {
+            group: {'path': str(out_dir / f'{group}.nc'), 'n_samples': job.result()}
+            for group, job in jobs.items()
+        }
+
+
+def main(argv=None):
+    """Aggregate the groups of footprint files described in a yaml configuration file.
+
+    The configuration contains `groups` (group -> list of footprint files) and optionally
+    `max_workers` and `variable`. The paths and sample counts are written to `aggregates.yaml`.
+    """
+    parser = argparse.ArgumentParser(description='Aggregate FLEXPART footprints with online statistics.')
+    parser.add_argument('-c', '--config', default='aggregate.yaml', help='yaml configuration file')
+    parser.add_argument('-o', '--output', default='aggregates.yaml', help='yaml summary file')
+    args = parser.parse_args(argv)
+
+    with open(args.config, 'r', encoding='utf-8') as handle:
+        config = yaml.safe_load(handle)
+
+    result = aggregate_groups(
+        config['groups'],
+        max_workers=config.get('max_workers'),
+        variable=config.get('variable', 'spec001_mr'),
+    )
+    with open(args.output, 'w', encoding='utf-8') as handle:
+        yaml.dump(result, handle)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Accuracy-bounded lossy compression of FLEXPART footprints.
+
+The mantissa of the footprint values is rounded to the smallest number of bits
+(bit-rounding, round to nearest, ties to even) that keeps the relative error below
+a given bound. The trailing zero bits make the subsequent zlib/zstd compression of
+the chunked variables much more effective. The bound and the number of kept bits
+are recorded in the attributes of each variable, the global attribute
+``compression`` is set to ``lossy``.
+
+Dense and sparse (see :mod:`aiida_flexpart.footprints.sparsify`) files are
+supported. The module can be run on the remote, see :func:`main`, and
+:func:`benchmark` measures the size reduction against the reconstruction error
+on synthetic footprints.
+"""
+import os
+import math
+import argparse
+import tempfile
+
+import numpy
+import netCDF4
+import yaml
+
+from .sparsify import get_footprint_variables, is_sparse
+
+
+def get_keepbits(rel_error, dtype='float32'):
+    """Smallest number of mantissa bits whose rounding error does not exceed `rel_error`.
+
+    Rounding to nearest with `k` mantissa bits has a relative error of at most ``2**-(k + 1)``.
+    """
+    nmant = numpy.finfo(dtype).nmant
+    if not rel_error or rel_error <= 0:
+        return nmant
+    return int(min(nmant, max(0, math.ceil(-math.log2(rel_error)) - 1)))
+
+
+def bitround(values, keepbits):
+    """Round the mantissa of floating point `values` to `keepbits` bits, non-finite values are left unchanged."""
+    values = numpy.array(values, copy=True)
+    nmant = numpy.finfo(values.dtype).nmant
+    if keepbits >= nmant:
+        return values
+    uint = numpy.dtype(f'u{values.dtype.itemsize}').type
+    one, maskbits = uint(1), uint(nmant - keepbits)
+    bits = values.view(uint)
+    finite = numpy.isfinite(values)
+    rounded = bits + ((bits >> maskbits) & one) + ((one << (maskbits - one)) - one)
+    rounded &= ~((one << maskbits) - one)
+    bits[finite] = rounded[finite]
+    return values
+
+
+def get_lossy_variables(nc_file):
+    """Footprint variables of a file, for a sparse file the arrays of their non-zero values."""
+    return [
+        f'{name}_value' if is_sparse(nc_file, name) else name for name in get_footprint_variables(nc_file)
+    ]
+
+
+def compress(in_path, out_path, rel_error=1e-3, variables=None, compression='zlib', compression_level=4):
+    """Write a bit-rounded and compressed copy of a NetCDF file.
+
+    :param rel_error: bound of the relative error, either one value or a dictionary keyed by variable.
+        Zero or None keeps the variable lossless.
+    :param variables: variables to round, by default the footprints. All variables are compressed.
+    :param compression: 'zlib' or 'zstd' (if supported by the netCDF library).
+    :param compression_level: compression level.
+    :return: number of mantissa bits kept per rounded variable.
+    """
+    keepbits = {}
+    with netCDF4.Dataset(str(in_path), mode='r') as source, \
+            netCDF4.Dataset(str(out_path), mode='w', format='NETCDF4') as target:
+        if variables is None:
+            variables = get_lossy_variables(source)
+        target.setncatts({key: source.getncattr(key) for key in source.ncattrs()})
+        for name, dimension in source.dimensions.items():
+            target.createDimension(name, None if dimension.isunlimited() else len(dimension))
+
+        for name, variable in source.variables.items():
+            chunksizes = None
+            if variable.dimensions:
+                chunksizes = [1 if i == 'time' else max(1, len(source.dimensions[i])) for i in variable.dimensions]
+            copy = target.createVariable(name, variable.dtype, variable.dimensions,
+                                         fill_value=getattr(variable, '_FillValue', None),
+                                         compression=compression if variable.dimensions else None,
+                                         complevel=compression_level, chunksizes=chunksizes)
+            copy.setncatts({key: variable.getncattr(key) for key in variable.ncattrs() if key != '_FillValue'})
+
+            if name not in variables:
+                copy[...] = variable[...]
+                continue
+
+            bound = rel_error.get(name) if isinstance(rel_error, dict) else rel_error
+            keepbits[name] = get_keepbits(bound, variable.dtype)
+            copy.setncatts({'bitround_keepbits': keepbits[name], 'bitround_relative_error': bound or 0.})
+            # one output time at a time, so that the memory use does not depend on the number of output times
+            if 'time' in variable.dimensions:
+                axis = variable.dimensions.index('time')
+                slices = [(slice(None),) * axis + (time,) for time in range(len(source.dimensions['time']))]
+            else:
+                slices = [Ellipsis]
+            for index in slices:
+                values = variable[index]
+                rounded = bitround(numpy.ma.getdata(values), keepbits[name])
+                copy[index] = numpy.ma.array(rounded, mask=numpy.ma.getmaskarray(values))
+
+        if keepbits:
+            target.setncatts({'compression': 'lossy', 'lossy_compression': 'bitround'})
+    return keepbits
+
+
+def synthetic_footprints(shape=(1, 4, 24, 1, 180, 240), seed=0):
+    """Random plumes spanning several orders of magnitude and zero elsewhere, like backward footprints."""
+    rng = numpy.random.default_rng(seed)
+    lat, lon = numpy.mgrid[:shape[-2], :shape[-1]]
+    footprints = numpy.zeros(shape, dtype='float32')
+    for point in range(shape[1]):
+        for time in range(shape[2]):
+            centre = rng.uniform(0.3, 0.7, 2) * shape[-2:]
+            width = (1 + time) * rng.uniform(2, 6, 2)
+            plume = numpy.exp(-((lat - centre[0])**2 / width[0]**2 + (lon - centre[1])**2 / width[1]**2))
+            plume *= rng.lognormal(0, 1, plume.shape)
+            plume[plume < 1e-4] = 0
+            footprints[0, point, time, 0] = plume
+    return footprints
+
+
+def benchmark(rel_errors=(1e-1, 1e-2, 1e-3, 1e-4, 1e-5), compression='zlib', **kwargs):
+    """Size reduction against reconstruction error of the bit-rounding on synthetic footprints.
+
+    The reference is the lossless compressed file. The keyword arguments are passed to :func:`synthetic_footprints`.
+    :return: list of dictionaries with the error bound, the kept bits, the size ratio and the maximum relative error.
+    """
+    footprints = synthetic_footprints(**kwargs)
+    dimensions = ('nageclass', 'pointspec', 'time', 'height', 'latitude', 'longitude')
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dense = os.path.join(tmpdir, 'grid_time.nc')
+        with netCDF4.Dataset(dense, mode='w', format='NETCDF4') as nc_file:
+            for name, size in zip(dimensions, footprints.shape):
+                nc_file.createDimension(name, size)
+            nc_file.createVariable('spec001_mr', 'f4', dimensions)[:] = footprints
+
+        reference = os.path.join(tmpdir, 'lossless.nc')
+        compress(dense, reference, rel_error=None, compression=compression)
+        reference_size = os.path.getsize(reference)
+        nonzero = footprints != 0
+        for rel_error in rel_errors:
+            out_path = os.path.join(tmpdir, f'{rel_error}.nc')
+            keepbits = compress(dense, out_path, rel_error=rel_error, compression=compression)
+            with netCDF4.Dataset(out_path, mode='r') as nc_file:
+                values = nc_file.variables['spec001_mr'][:]
+            error = numpy.abs(values[nonzero] - footprints[nonzero]) / footprints[nonzero]
+            results.append({
+                'rel_error': rel_error,
+                'keepbits': keepbits['spec001_mr'],
+                'size_ratio': reference_size / os.path.getsize(out_path),
+                'max_rel_error': float(error.max()),
+            })
+    return results
+
+
+def main(argv=None):
+    """Compress the files described in a yaml configuration file, or run the benchmark.
+
+    The configuration contains `files` (output file -> input file) and optionally
+    `rel_error`, `variables`, `compression` and `compression_level`.
+    """
+    parser = argparse.ArgumentParser(description='Bit-round and compress FLEXPART footprints.')
+    parser.add_argument('-c', '--config', default='compress.yaml', help='yaml configuration file')
+    parser.add_argument('--benchmark', action='store_true', help='benchmark on synthetic footprints')
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        print(f"{'bound':>8} {'bits':>5} {'ratio':>7} {'max error':>10}")
+        for result in benchmark():
+            print(f"{result['rel_error']:8.0e} {result['keepbits']:5d} "
+                  f"{result['size_ratio']:7.2f} {result['max_rel_error']:10.2e}")
+        return
+
+    with open(args.config, 'r', encoding='utf-8') as handle:
+        config = yaml.safe_load(handle)
+    kwargs = {
+        key: config[key] for key in ('rel_error', 'variables', 'compression', 'compression_level') if key in config
+    }
+
+    for out_path, in_path in config['files'].items():
+        keepbits = compress(in_path, out_path, **kwargs)
+        print(f'{in_path} -> {out_path}: {keepbits}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Assembly of the Jacobian (H matrix) of the inversion from FLEXPART footprints.
+
+H[i, j] is the sensitivity of the observation (release point) i to the flux of the
+region j. The footprints are read one output time at a time and aggregated to the
+regions with a sparse weight matrix, the result is written to a memory-mapped
+``.npy`` file: the memory use depends neither on the number of output times nor
+on the number of observations of a site. Sparse footprint files (see
+:mod:`aiida_flexpart.footprints.sparsify`) are read like dense ones.
+
+The module can be run on the remote, see :func:`main`.
+"""
+import argparse
+import pathlib
+
+import numpy
+import netCDF4
+import yaml
+from scipy import sparse
+
+from . import process_pool
+from .sparsify import get_time_slice
+
+
+def region_weights(region_mask, area=None):
+    """Sparse aggregation matrix from the grid cells to the regions.
+
+    :param region_mask: integer array (latitude, longitude) with the region index of each cell,
+        negative outside of all the regions.
+    :param area: optional array (latitude, longitude) of the weights of the cells, e.g. their area.
+    :return: `scipy.sparse.csr_matrix` of shape (n_cells, n_regions).
+    """
+    mask = numpy.asarray(region_mask, dtype=int).ravel()
+    cells = numpy.flatnonzero(mask >= 0)
+    if area is None:
+        values = numpy.ones(cells.size)
+    else:
+        values = numpy.asarray(area, dtype=float).ravel()[cells]
+    return sparse.csr_matrix((values, (cells, mask[cells])), shape=(mask.size, mask.max(initial=-1) + 1))
+
+
+def get_n_releases(path):
+    """Number of release points (observations) of a footprint file."""
+    with netCDF4.Dataset(str(path), mode='r') as nc_file:
+        return len(nc_file.dimensions['pointspec'])
+
+
+def assemble_jacobian(paths, weights, out_path, variable='spec001_mr', height=0, ageclass=0, dtype='float32'):
+    """Assemble the Jacobian of one site.
+
+    :param paths: footprint files of the site, the releases of the files are stacked in this order.
+    :param weights: aggregation matrix from :func:`region_weights`.
+    :param out_path: path of the ``.npy`` file to write.
+    :param variable: footprint variable, with dimensions (nageclass, pointspec, time, height, latitude, longitude).
+    :param height: index of the output level to use.
+    :param ageclass: index of the age class to use.
+    :return: shape of the Jacobian.
+    """
+    n_regions = weights.shape[1]
+    weights_t = sparse.csr_matrix(weights.T)
+    n_obs = sum(get_n_releases(path) for path in paths)
+    jacobian = numpy.lib.format.open_memmap(str(out_path), mode='w+', dtype=dtype, shape=(n_obs, n_regions))
+
+    row = 0
+    for path in paths:
+        with netCDF4.Dataset(str(path), mode='r') as nc_file:
+            n_points = len(nc_file.dimensions['pointspec'])
+            n_cells = len(nc_file.dimensions['latitude']) * len(nc_file.dimensions['longitude'])
+            # accumulate in double precision over the output times
+            block = numpy.zeros((n_regions, n_points))
+            for time in range(len(nc_file.dimensions['time'])):
+                footprint = get_time_slice(nc_file, variable, time)[ageclass, :, height].reshape(n_points, n_cells)
+                block += weights_t @ footprint.T
+        jacobian[row:row + n_points] = block.T
+        row += n_points
+
+    jacobian.flush()
+    return jacobian.shape
+
+
+def assemble_jacobians(sites, weights, out_dir='.', max_workers=None, **kwargs):
+    """Assemble the Jacobians of several sites in parallel, one process per site.
+
+    :param sites: dictionary mapping the sites to their footprint files.
+    :return: dictionary mapping the sites to the path and the shape of their Jacobian.
+    """
+    out_dir = pathlib.Path(out_dir)
+    with process_pool(max_workers) as executor:
+        jobs = {
+            site: executor.submit(assemble_jacobian, sorted(paths), weights, out_dir / f'H_{site}.npy', **kwargs)
+            for site, paths in sites.items()
+        }
+        return {
+            site: {'path': str(out_dir / f'H_{site}.npy'), 'shape': list(job.result())}
+            for site, job in jobs.items()
+        }
+
+
+def main(argv=None):
+    """Assemble the Jacobians described in a yaml configuration file.
+
+    The configuration contains `sites` (site -> list of footprint files), `weights` (``.npz``
+    file written by `scipy.sparse.save_npz`) and optionally `max_workers`, `variable`, `height`
+    and `ageclass`. The paths and shapes of the Jacobians are written to `jacobians.yaml`.
+    """
+    parser = argparse.ArgumentParser(description='Assemble the inversion Jacobians from FLEXPART footprints.')
+    parser.add_argument('-c', '--config', default='jacobian.yaml', help='yaml configuration file')
+    parser.add_argument('-o', '--output', default='jacobians.yaml', help='yaml summary file')
+    args = parser.parse_args(argv)
+
+    with open(args.config, 'r', encoding='utf-8') as handle:
+        config = yaml.safe_load(handle)
+    kwargs = {key: config[key] for key in ('variable', 'height', 'ageclass') if key in config}
+
+    result = assemble_jacobians(
+        config['sites'],
+        sparse.load_npz(config['weights']),
+        max_workers=config.get('max_workers'),
+        **kwargs,
+    )
+    with open(args.output, 'w', encoding='utf-8') as handle:
+        yaml.dump(result, handle)
+
+
+if __name__ == '__main__':
+    main()
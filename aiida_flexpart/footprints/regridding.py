@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Conservative regridding of FLEXPART outputs between regular latitude-longitude grids.
+
+The grids are the dictionaries of `outgrid.yaml` and `outgrid_nest.yaml` (the inputs
+`outgrid` and `outgrid_nest` of the calculations). The footprint arrays have
+`number_of_grid_points_x` by `number_of_grid_points_y` cells, whose lower left
+corner is at `longitude_of_output_grid`, `latitude_of_output_grid`.
+
+The weights are the overlap areas of the cells on the sphere. On a regular grid they
+factorize into a longitude and a latitude part, hence the sparse weight matrix is the
+Kronecker product of two small one dimensional matrices. Weight matrices are cached
+on disk under the hash of the two grids, regridding is a sparse product per output time.
+
+The module can be run on the remote, see :func:`main`.
+"""
+import os
+import json
+import hashlib
+import argparse
+
+import numpy
+import netCDF4
+import yaml
+from scipy import sparse
+
+from .sparsify import get_time_slice, get_footprint_variables, get_storage_variables
+
+GRID_KEYS = (
+    'output_grid_type',
+    'longitude_of_output_grid',
+    'latitude_of_output_grid',
+    'number_of_grid_points_x',
+    'number_of_grid_points_y',
+    'grid_distance_x',
+    'grid_distance_y',
+)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'aiida_flexpart', 'regridding')
+
+
+def get_edges(grid):
+    """Longitude and latitude edges of the cells of a grid dictionary."""
+    lon = grid['longitude_of_output_grid'] + grid['grid_distance_x'] * numpy.arange(grid['number_of_grid_points_x'] + 1)
+    lat = grid['latitude_of_output_grid'] + grid['grid_distance_y'] * numpy.arange(grid['number_of_grid_points_y'] + 1)
+    return lon, lat
+
+
+def get_centres(grid):
+    """Longitude and latitude of the centres of the cells of a grid dictionary."""
+    lon, lat = get_edges(grid)
+    return (lon[1:] + lon[:-1]) / 2, (lat[1:] + lat[:-1]) / 2
+
+
+def get_grid_hash(*grids, **options):
+    """Hash of grid definitions (and options), only the keys defining the horizontal grid are used."""
+    description = [{key: grid.get(key, 0) for key in GRID_KEYS} for grid in grids]
+    return hashlib.sha256(json.dumps([description, options], sort_keys=True).encode()).hexdigest()
+
+
+def overlaps(source, target):
+    """Overlap lengths of the intervals between the `source` and `target` edges, as a sparse matrix (target, source)."""
+    low = numpy.maximum.outer(target[:-1], source[:-1])
+    high = numpy.minimum.outer(target[1:], source[1:])
+    return sparse.csr_matrix(numpy.clip(high - low, 0, None))
+
+
+def build_weights(source_grid, target_grid, normalize='sum'):
+    """Conservative weight matrix (target cells, source cells) between two grids.
+
+    :param normalize: 'sum' for quantities given per cell, which add up when cells are merged
+        (e.g. footprints), 'mean' for quantities given per unit area (e.g. fluxes).
+    """
+    if source_grid.get('output_grid_type', 0) != target_grid.get('output_grid_type', 0):
+        raise ValueError('the grids must be defined in the same (rotated or geographical) coordinate system')
+    if normalize not in ('sum', 'mean'):
+        raise ValueError(f"normalize should be 'sum' or 'mean', not '{normalize}'")
+
+    source_lon, source_lat = get_edges(source_grid)
+    target_lon, target_lat = get_edges(target_grid)
+    # the area of a cell on the sphere is proportional to its width in longitude times its width in sin(latitude)
+    weights_lon = overlaps(source_lon, target_lon)
+    weights_lat = overlaps(numpy.sin(numpy.radians(source_lat)), numpy.sin(numpy.radians(target_lat)))
+    weights = sparse.csr_matrix(sparse.kron(weights_lat, weights_lon))
+
+    if normalize == 'sum':
+        # fraction of each source cell falling into the target cells
+        area = numpy.kron(numpy.diff(numpy.sin(numpy.radians(source_lat))), numpy.diff(source_lon))
+        weights = weights @ sparse.diags(1 / area)
+    else:
+        # area-weighted mean over the covered part of each target cell
+        covered = numpy.asarray(weights.sum(axis=1)).ravel()
+        weights = sparse.diags(numpy.divide(1, covered, out=numpy.zeros_like(covered), where=covered > 0)) @ weights
+    return sparse.csr_matrix(weights)
+
+
+def get_weights(source_grid, target_grid, normalize='sum', cache_dir=DEFAULT_CACHE_DIR):
+    """Weight matrix of :func:`build_weights`, read from or written to the cache directory."""
+    if cache_dir is None:
+        return build_weights(source_grid, target_grid, normalize)
+    path = os.path.join(cache_dir, f'{get_grid_hash(source_grid, target_grid, normalize=normalize)}.npz')
+    if os.path.exists(path):
+        return sparse.load_npz(path)
+    weights = build_weights(source_grid, target_grid, normalize)
+    os.makedirs(cache_dir, exist_ok=True)
+    # write then rename, so that concurrent runs never read a partial file
+    temp_path = f'{path}.{os.getpid()}.npz'
+    sparse.save_npz(temp_path, weights)
+    os.replace(temp_path, path)
+    return weights
+
+
+def regrid(values, weights, target_grid):
+    """Regrid an array whose last two axes are (latitude, longitude)."""
+    values = numpy.asarray(values)
+    shape = values.shape[:-2]
+    result = weights @ values.reshape(-1, values.shape[-2] * values.shape[-1]).T
+    return result.T.reshape(shape + (target_grid['number_of_grid_points_y'], target_grid['number_of_grid_points_x']))
+
+
+def regrid_file(in_path, out_path, source_grid, target_grid, variables=None, normalize='sum',
+                cache_dir=DEFAULT_CACHE_DIR):
+    """Write the variables of a FLEXPART output file regridded to `target_grid`, one output time at a time.
+
+    :param variables: variables to regrid, by default the footprints. Their last two dimensions
+        must be latitude and longitude. The other variables that do not depend on latitude and
+        longitude are copied, sparse footprints are written dense.
+    """
+    weights = get_weights(source_grid, target_grid, normalize, cache_dir)
+    longitude, latitude = get_centres(target_grid)
+    with netCDF4.Dataset(str(in_path), mode='r') as source, \
+            netCDF4.Dataset(str(out_path), mode='w', format='NETCDF4') as target:
+        if variables is None:
+            variables = get_footprint_variables(source)
+        target.setncatts({key: source.getncattr(key) for key in source.ncattrs()})
+        target.setncattr('regridding', f'conservative ({normalize})')
+        storage = get_storage_variables(source)
+        for name, dimension in source.dimensions.items():
+            if name in storage or name.endswith('_nnz'):
+                continue
+            if name == 'latitude':
+                size = len(latitude)
+            elif name == 'longitude':
+                size = len(longitude)
+            else:
+                size = None if dimension.isunlimited() else len(dimension)
+            target.createDimension(name, size)
+        for name, values in (('latitude', latitude), ('longitude', longitude)):
+            coordinate = target.createVariable(name, 'f4', (name,))
+            if name in source.variables:
+                coordinate.setncatts({key: source.variables[name].getncattr(key)
+                                      for key in source.variables[name].ncattrs() if key != '_FillValue'})
+            coordinate[:] = values
+
+        for name, variable in source.variables.items():
+            horizontal = {'latitude', 'longitude'} & set(variable.dimensions)
+            if name in variables or name in storage or name in ('latitude', 'longitude') or horizontal:
+                continue
+            copy = target.createVariable(name, variable.dtype, variable.dimensions,
+                                         fill_value=getattr(variable, '_FillValue', None))
+            copy.setncatts({key: variable.getncattr(key) for key in variable.ncattrs() if key != '_FillValue'})
+            copy[...] = variable[...]
+
+        for name in variables:
+            variable = source.variables[name]
+            dimensions = getattr(variable, 'sparse_dimensions', ' '.join(variable.dimensions)).split()
+            regridded = target.createVariable(name, variable.dtype, dimensions, zlib=True, complevel=4)
+            regridded.setncatts({key: variable.getncattr(key) for key in variable.ncattrs()
+                                 if key not in ('_FillValue', 'sparse_format', 'sparse_dimensions')})
+            axis = dimensions.index('time')
+            for time in range(len(source.dimensions['time'])):
+                regridded[(slice(None),) * axis + (time,)] = regrid(
+                    get_time_slice(source, name, time), weights, target_grid)
+    return weights.shape
+
+
+def main(argv=None):
+    """Regrid the files described in a yaml configuration file.
+
+    The configuration contains `files` (output file -> input file), the grid dictionaries
+    `source_grid` and `target_grid` and optionally `variables`, `normalize` and `cache_dir`.
+    """
+    parser = argparse.ArgumentParser(description='Conservative regridding of FLEXPART outputs.')
+    parser.add_argument('-c', '--config', default='regrid.yaml', help='yaml configuration file')
+    args = parser.parse_args(argv)
+
+    with open(args.config, 'r', encoding='utf-8') as handle:
+        config = yaml.safe_load(handle)
+    kwargs = {key: config[key] for key in ('variables', 'normalize', 'cache_dir') if key in config}
+
+    for out_path, in_path in config['files'].items():
+        shape = regrid_file(in_path, out_path, config['source_grid'], config['target_grid'], **kwargs)
+        print(f'{in_path} -> {out_path}: {shape}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Sparse storage of FLEXPART footprints in NetCDF.
+
+Backward footprints are zero outside of the plume. A sparse variable keeps the
+non-zero values of each output time in coordinate (COO) format, the output times
+are indexed like the rows of a CSR matrix:
+
+* ``<name>_offset(time + 1)``: start of each output time in the two arrays below;
+* ``<name>_index(<name>_nnz)``: flat index of the value in the output time slice, 4 byte
+  unsigned integers, 8 byte ones for slices of more than 2**32 cells;
+* ``<name>_value(<name>_nnz)``: the non-zero values.
+
+``<name>`` itself becomes a scalar placeholder holding the attributes of the dense
+variable plus ``sparse_format`` and ``sparse_dimensions``, the global attribute
+``sparse_variables`` lists the sparse variables of the file. All the other variables,
+dimensions and attributes are copied unchanged. :func:`read_variable` and
+:func:`get_time_slice` read dense and sparse files alike.
+
+The module can be run on the remote, see :func:`main`.
+"""
+import argparse
+
+import numpy
+import netCDF4
+import yaml
+
+SPARSE_FORMAT = 'coo'
+
+
+def is_sparse(nc_file, name):
+    """Whether the variable `name` of the open dataset `nc_file` is stored sparse."""
+    return getattr(nc_file.variables[name], 'sparse_format', None) == SPARSE_FORMAT
+
+
+def get_footprint_variables(nc_file):
+    """Floating point variables of at least 3 dimensions that depend on time, i.e. the footprints, dense or sparse."""
+    return [
+        name for name, variable in nc_file.variables.items()
+        if is_sparse(nc_file, name) or
+        ('time' in variable.dimensions and len(variable.dimensions) >= 3 and variable.dtype.kind == 'f')
+    ]
+
+
+def get_storage_variables(nc_file):
+    """Names of the variables storing the values of the sparse variables."""
+    return {
+        f'{name}_{suffix}' for name in getattr(nc_file, 'sparse_variables', '').split()
+        for suffix in ('offset', 'index', 'value')
+    }
+
+
+def get_time_slice(nc_file, name, time):
+    """Dense values of the variable `name` at the output time index `time`, without the time axis."""
+    variable = nc_file.variables[name]
+    if not is_sparse(nc_file, name):
+        variable.set_auto_mask(False)
+        return variable[(slice(None),) * variable.dimensions.index('time') + (time,)]
+
+    dimensions = variable.sparse_dimensions.split()
+    shape = [len(nc_file.dimensions[i]) for i in dimensions if i != 'time']
+    start, end = nc_file.variables[f'{name}_offset'][time:time + 2]
+    values = numpy.zeros(int(numpy.prod(shape)), dtype=variable.dtype)
+    values[nc_file.variables[f'{name}_index'][start:end]] = nc_file.variables[f'{name}_value'][start:end]
+    return values.reshape(shape)
+
+
+def get_dense(nc_file, name):
+    """Dense values of the sparse variable `name` of the open dataset `nc_file`."""
+    axis = nc_file.variables[name].sparse_dimensions.split().index('time')
+    n_times = len(nc_file.dimensions['time'])
+    return numpy.stack([get_time_slice(nc_file, name, i) for i in range(n_times)], axis=axis)
+
+
+def read_variable(path, name, time=None):
+    """Read a variable of a NetCDF file as a dense array, whether it is stored dense or sparse.
+
+    :param time: optional output time index, only this output time is read.
+    """
+    with netCDF4.Dataset(str(path), mode='r') as nc_file:
+        if time is not None:
+            return get_time_slice(nc_file, name, time)
+        if not is_sparse(nc_file, name):
+            return nc_file.variables[name][:]
+        return get_dense(nc_file, name)
+
+
+def _copy_attributes(source, target, skip=()):
+    target.setncatts({key: source.getncattr(key) for key in source.ncattrs() if key not in skip})
+
+
+def to_sparse(in_path, out_path, variables=None, threshold=0., compression_level=4):
+    """Write a copy of a NetCDF file with the footprint variables stored sparse.
+
+    :param variables: names of the variables to convert, by default all the footprints.
+    :param threshold: values whose magnitude does not exceed the threshold are dropped.
+        The default only drops exact zeros, so that the conversion is lossless.
+    :param compression_level: deflate level of the sparse arrays.
+    :return: number of non-zero values kept per variable.
+    """
+    nnz = {}
+    with netCDF4.Dataset(str(in_path), mode='r') as source, \
+            netCDF4.Dataset(str(out_path), mode='w', format='NETCDF4') as target:
+        if variables is None:
+            variables = [name for name in get_footprint_variables(source) if not is_sparse(source, name)]
+        _copy_attributes(source, target)
+        target.setncattr('sparse_variables', ' '.join(variables))
+        for name, dimension in source.dimensions.items():
+            target.createDimension(name, None if dimension.isunlimited() else len(dimension))
+
+        for name, variable in source.variables.items():
+            fill_value = getattr(variable, '_FillValue', None)
+            if name not in variables:
+                copy = target.createVariable(name, variable.dtype, variable.dimensions, fill_value=fill_value,
+                                             zlib=True, complevel=compression_level)
+                _copy_attributes(variable, copy, skip=('_FillValue',))
+                copy.set_auto_mask(False)
+                variable.set_auto_mask(False)
+                copy[:] = variable[:]
+                continue
+
+            placeholder = target.createVariable(name, variable.dtype, ())
+            _copy_attributes(variable, placeholder, skip=('_FillValue',))
+            placeholder.setncatts({'sparse_format': SPARSE_FORMAT,
+                                   'sparse_dimensions': ' '.join(variable.dimensions)})
+            n_times = len(source.dimensions['time'])
+            target.createDimension(f'{name}_nnz', None)
+            target.createDimension(f'{name}_offset', n_times + 1)
+            offsets = target.createVariable(f'{name}_offset', 'i8', (f'{name}_offset',))
+            n_cells = numpy.prod([len(source.dimensions[i]) for i in variable.dimensions if i != 'time'], dtype='i8')
+            index_type = 'u4' if n_cells <= 2**32 else 'u8'
+            indices = target.createVariable(f'{name}_index', index_type, (f'{name}_nnz',),
+                                            zlib=True, complevel=compression_level)
+            values = target.createVariable(f'{name}_value', variable.dtype, (f'{name}_nnz',),
+                                           zlib=True, complevel=compression_level)
+
+            offset = numpy.zeros(n_times + 1, dtype='i8')
+            for time in range(n_times):
+                dense = numpy.ma.getdata(get_time_slice(source, name, time)).ravel()
+                index = numpy.flatnonzero(numpy.abs(dense) > threshold)
+                offset[time + 1] = offset[time] + index.size
+                indices[offset[time]:offset[time + 1]] = index
+                values[offset[time]:offset[time + 1]] = dense[index]
+            offsets[:] = offset
+            nnz[name] = int(offset[-1])
+    return nnz
+
+
+def main(argv=None):
+    """Convert the footprint files described in a yaml configuration file.
+
+    The configuration contains `files` (output file -> input file) and optionally
+    `variables`, `threshold` and `compression_level`.
+    """
+    parser = argparse.ArgumentParser(description='Store FLEXPART footprints in sparse NetCDF files.')
+    parser.add_argument('-c', '--config', default='sparsify.yaml', help='yaml configuration file')
+    args = parser.parse_args(argv)
+
+    with open(args.config, 'r', encoding='utf-8') as handle:
+        config = yaml.safe_load(handle)
+    kwargs = {key: config[key] for key in ('variables', 'threshold', 'compression_level') if key in config}
+
+    for out_path, in_path in config['files'].items():
+        nnz = to_sparse(in_path, out_path, **kwargs)
+        print(f'{in_path} -> {out_path}: {nnz}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Parsers provided by aiida_flexpart.
+
+Register parsers via the "aiida.parsers" entry point in setup.json.
+"""
+import os
+import tempfile
+
+import yaml
+from aiida import engine, parsers, plugins, common, orm
+
+from ..utils import get_nc_arrays
+
+AggregateFootprintsCalculation = plugins.CalculationFactory('footprints.aggregate')
+
+
+class AggregateFootprintsParser(parsers.Parser):
+    """
+    Parser class for parsing output of calculation.
+    """
+    def __init__(self, node):
+        """
+        Initialize Parser instance
+
+        Checks that the ProcessNode being passed was produced by an AggregateFootprintsCalculation.
+
+        :param node: ProcessNode of calculation
+        :param type node: :class:`aiida.orm.ProcessNode`
+        """
+        super().__init__(node)
+        if not issubclass(node.process_class, AggregateFootprintsCalculation):
+            raise common.ParsingError('Can only parse AggregateFootprintsCalculation')
+
+    def parse(self, **kwargs):
+        """
+        Parse outputs, store results in database.
+
+        :returns: an exit code, if parsing fails (or nothing if parsing succeeds)
+        """
+        output_filename = self.node.get_option('output_filename')
+
+        # Check that folder content is as expected
+        files_retrieved = self.retrieved.list_object_names()
+        files_expected = [output_filename, 'aggregates.yaml']
+        # Note: set(A) <= set(B) checks whether A is a subset of B
+        if not set(files_expected) <= set(files_retrieved):
+            self.logger.error(
+                f"Found files '{files_retrieved}', expected to find '{files_expected}'"
+            )
+            return self.exit_codes.ERROR_MISSING_OUTPUT_FILES
+
+        with self.retrieved.open(output_filename, 'rb') as handle:
+            output_node = orm.SinglefileData(file=handle)
+        self.out('output_file', output_node)
+
+        with self.retrieved.open('aggregates.yaml', 'r') as handle:
+            aggregates = yaml.safe_load(handle)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for group, result in aggregates.items():
+                filename = os.path.basename(result['path'])
+                if filename not in files_retrieved:
+                    self.logger.error(f"Statistics '{filename}' of {group} were not retrieved")
+                    return self.exit_codes.ERROR_MISSING_OUTPUT_FILES
+                local_path = os.path.join(tmpdir, filename)
+                with self.retrieved.open(filename, 'rb') as source, open(local_path, 'wb') as target:
+                    target.write(source.read())
+                arrays, units = get_nc_arrays(local_path)
+
+                node = orm.ArrayData()
+                for name, values in arrays.items():
+                    node.set_array(name, values)
+                # the footprints whose month is unknown are grouped by site only
+                site, _, month = group.partition('_')
+                node.base.attributes.set('units', units)
+                node.base.attributes.set('n_samples', result['n_samples'])
+                node.base.attributes.set('site', site)
+                node.base.attributes.set('month', month or None)
+                self.out(f'aggregates.{group}', node)
+
+        return engine.ExitCode(0)
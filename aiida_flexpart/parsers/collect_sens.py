@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Parsers provided by aiida_flexpart.
+
+Register parsers via the "aiida.parsers" entry point in setup.json.
+"""
+import re
+import pathlib
+import collections
+
+from aiida import engine, parsers, plugins, common, orm
+
+from aiida_flexpart.utils import get_nc_header
+
+CollectSensitivitiesCalculation = plugins.CalculationFactory('collect.sensitivities')
+NetCDF = plugins.DataFactory('netcdf.data')
+
+# a year from 1900 to 2099 and a month, not inside a longer run of digits
+_MONTH_PATTERN = re.compile(r'(?<!\d)((?:19|20)\d{2})[-_]?(0[1-9]|1[0-2])(?!\d)')
+
+
+def get_site_and_month(filename, sites):
+    """Find the release site and the month (YYYYMM) a collected file belongs to from its name.
+
+    The site must appear as a whole token of the name, delimited by non alphanumeric characters.
+    """
+    stem = pathlib.Path(filename).stem
+    site = next((s for s in sorted(sites, key=len, reverse=True)
+                 if re.search(rf'(?<![0-9a-zA-Z]){re.escape(s)}(?![0-9a-zA-Z])', stem)), None)
+    month = _MONTH_PATTERN.search(stem)
+    return site, ''.join(month.groups()) if month else None
+
+
+class CollectSensParser(parsers.Parser):
+    """
+    Parser class for parsing output of calculation.
+    """
+    def __init__(self, node):
+        """
+        Initialize Parser instance
+
+        Checks that the ProcessNode being passed was produced by a CollectSensitivitiesCalculation.
+
+        :param node: ProcessNode of calculation
+        :param type node: :class:`aiida.orm.ProcessNode`
+        """
+        super().__init__(node)
+        if not issubclass(node.process_class, CollectSensitivitiesCalculation):
+            raise common.ParsingError('Can only parse CollectSensitivitiesCalculation')
+
+    def parse(self, **kwargs):
+        """
+        Parse outputs, store results in database.
+
+        :returns: an exit code, if parsing fails (or nothing if parsing succeeds)
+        """
+        output_filename = self.node.get_option('output_filename')
+
+        # Check that folder content is as expected
+        files_retrieved = self.retrieved.list_object_names()
+        files_expected = [output_filename]
+        # Note: set(A) <= set(B) checks whether A is a subset of B
+        if not set(files_expected) <= set(files_retrieved):
+            self.logger.error(
+                f"Found files '{files_retrieved}', expected to find '{files_expected}'"
+            )
+            return self.exit_codes.ERROR_MISSING_OUTPUT_FILES
+
+        # add output file
+        self.logger.info(f"Parsing '{output_filename}'")
+        with self.retrieved.open(output_filename, 'rb') as handle:
+            output_node = orm.SinglefileData(file=handle)
+        self.out('output_file', output_node)
+
+        self.parse_nc_files([f for f in files_retrieved if f.endswith('.nc')])
+
+        return engine.ExitCode(0)
+
+    def parse_nc_files(self, nc_files):
+        """
+        Register the collected NetCDF files as `NetCdfData` outputs keyed by site and month.
+
+        Only the headers are read, the nodes point at the files in the remote working directory.
+        """
+        # the keys of the `remote` namespace are the simulation date (YYYY_MM_DD) followed by the site
+        sites = {key[10:] for key in self.node.inputs.remote}
+        remote_workdir = pathlib.Path(self.node.get_remote_workdir())
+
+        # the header reads take milliseconds, a pool of processes would cost more than it saves
+        with self.retrieved.base.repository.as_path() as dirpath:
+            headers = [get_nc_header(pathlib.Path(dirpath) / f) for f in nc_files]
+
+        site_months = [get_site_and_month(filename, sites) for filename in nc_files]
+        stems = [re.sub(r'[^0-9a-zA-Z_]', '_', pathlib.Path(filename).stem) for filename in nc_files]
+        labels = [f'{site}_{month}' if site and month else stem for stem, (site, month) in zip(stems, site_months)]
+        # files sharing a site and month keep their own name
+        counts = collections.Counter(labels)
+        labels = [label if counts[label] == 1 else stem for stem, label in zip(stems, labels)]
+
+        for filename, (nc_dimensions, global_att), (site, month), label in zip(nc_files, headers, site_months, labels):
+            self.out(
+                f'nc_files.{label}',
+                NetCDF(
+                    filename,
+                    remote_path=str(remote_workdir / filename),
+                    computer=self.node.computer,
+                    g_att=global_att,
+                    nc_dimensions=nc_dimensions,
+                    other={'site': site, 'month': month},
+                )
+            )
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Parsers provided by aiida_flexpart.
+
+Register parsers via the "aiida.parsers" entry point in setup.json.
+"""
+import yaml
+
+from aiida import engine, parsers, plugins, common, orm
+
+CompactParticlesCalculation = plugins.CalculationFactory('particles.compact')
+
+
+class CompactParticlesParser(parsers.Parser):
+    """
+    Parser class for parsing output of calculation.
+    """
+    def __init__(self, node):
+        """
+        Initialize Parser instance
+
+        Checks that the ProcessNode being passed was produced by a CompactParticlesCalculation.
+
+        :param node: ProcessNode of calculation
+        :param type node: :class:`aiida.orm.ProcessNode`
+        """
+        super().__init__(node)
+        if not issubclass(node.process_class, CompactParticlesCalculation):
+            raise common.ParsingError('Can only parse CompactParticlesCalculation')
+
+    def parse(self, **kwargs):
+        """
+        Parse outputs, store results in database.
+
+        :returns: an exit code, if parsing fails (or nothing if parsing succeeds)
+        """
+        files_retrieved = self.retrieved.list_object_names()
+        if 'compaction.yaml' not in files_retrieved:
+            self.logger.error(
+                f"Found files '{files_retrieved}', expected to find 'compaction.yaml'"
+            )
+            return self.exit_codes.ERROR_MISSING_OUTPUT_FILES
+
+        with self.retrieved.open('compaction.yaml', 'r') as handle:
+            compaction = yaml.safe_load(handle)
+        self.logger.info(
+            f"kept {compaction['n_particles_out']} of {compaction['n_particles_in']} particles"
+        )
+        self.out('compaction', orm.Dict(compaction))
+
+        return engine.ExitCode(0)
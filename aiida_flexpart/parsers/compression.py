@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+"""
+Parsers provided by aiida_flexpart.
+
+Register parsers via the "aiida.parsers" entry point in setup.json.
+"""
+from aiida import plugins
+
+from aiida_flexpart.parsers.sparsify import SparsifyFootprintsParser
+
+CompressFootprintsCalculation = plugins.CalculationFactory('footprints.compress')
+
+
+class CompressFootprintsParser(SparsifyFootprintsParser):
+    """
+    Parser class for parsing output of calculation.
+    """
+    calculation_class = CompressFootprintsCalculation
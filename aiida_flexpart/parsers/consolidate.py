@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Parsers provided by aiida_flexpart.
+
+Register parsers via the "aiida.parsers" entry point in setup.json.
+"""
+import pathlib
+
+from aiida import engine, parsers, plugins, common
+
+from aiida_flexpart.utils import parse_ncdump_headers, NC_HEADERS_FILENAME
+from aiida_flexpart.calculations.consolidate import group_by_site
+
+ConsolidateFootprintsCalculation = plugins.CalculationFactory('footprints.consolidate')
+NetCDF = plugins.DataFactory('netcdf.data')
+
+
+class ConsolidateFootprintsParser(parsers.Parser):
+    """
+    Parser class for parsing output of calculation.
+    """
+    def __init__(self, node):
+        """
+        Initialize Parser instance
+
+        Checks that the ProcessNode being passed was produced by a ConsolidateFootprintsCalculation.
+
+        :param node: ProcessNode of calculation
+        :param type node: :class:`aiida.orm.ProcessNode`
+        """
+        super().__init__(node)
+        if not issubclass(node.process_class, ConsolidateFootprintsCalculation):
+            raise common.ParsingError('Can only parse ConsolidateFootprintsCalculation')
+
+    def parse(self, **kwargs):
+        """
+        Parse outputs, store results in database.
+
+        :returns: an exit code, if parsing fails (or nothing if parsing succeeds)
+        """
+        files_retrieved = self.retrieved.list_object_names()
+        if NC_HEADERS_FILENAME not in files_retrieved:
+            self.logger.error(
+                f"Found files '{files_retrieved}', expected to find '{NC_HEADERS_FILENAME}'"
+            )
+            return self.exit_codes.ERROR_MISSING_OUTPUT_FILES
+
+        with self.retrieved.open(NC_HEADERS_FILENAME, 'r') as handle:
+            headers = parse_ncdump_headers(handle.read())
+
+        remote_workdir = pathlib.Path(self.node.get_remote_workdir())
+        by_month = self.node.inputs.by_month.value
+        for group in group_by_site(self.node.inputs.remotes, by_month):
+            if f'{group}.nc' not in headers:
+                self.logger.error(f"No consolidated footprint file for '{group}'")
+                return self.exit_codes.ERROR_MISSING_OUTPUT_FILES
+            nc_dimensions, global_att = headers[f'{group}.nc']
+            site, _, month = group.partition('_')
+            self.out(
+                f'consolidated.{group}',
+                NetCDF(
+                    f'{group}.nc',
+                    remote_path=str(remote_workdir / f'{group}.nc'),
+                    computer=self.node.computer,
+                    g_att=global_att,
+                    nc_dimensions=nc_dimensions,
+                    other={'site': site, 'month': month or None},
+                )
+            )
+
+        return engine.ExitCode(0)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Parsers provided by aiida_flexpart.
+
+Register parsers via the "aiida.parsers" entry point in setup.json.
+"""
+import os
+import pathlib
+
+from aiida import parsers, plugins, common, orm, engine
+
+from aiida_flexpart.utils import get_nc_header, parse_ncdump_headers, parse_flexpart_log, compact_log
+from aiida_flexpart.utils import NC_HEADERS_FILENAME, NC_SUBSET_FOLDER
+from aiida_flexpart.readers.header import read_header
+
+NetCDF = plugins.DataFactory('netcdf.data')
+
+
+class FlexpartBaseParser(parsers.Parser):
+    """
+    Parser class for parsing output of calculation.
+
+    Shared by the FLEXPART calculations, the subclasses set `calculation_class`.
+    """
+    calculation_class = None
+
+    def __init__(self, node):
+        """
+        Initialize Parser instance
+
+        Checks that the ProcessNode being passed was produced by a `calculation_class` calculation.
+
+        :param node: ProcessNode of calculation
+        :param type node: :class:`aiida.orm.ProcessNode`
+        """
+        super().__init__(node)
+        if not issubclass(node.process_class, self.calculation_class):
+            raise common.ParsingError(f'Can only parse {self.calculation_class.__name__}')
+
+    def parse(self, **kwargs):
+        """
+        Parse outputs, store results in database.
+
+        :returns: an exit code, if parsing fails (or nothing if parsing succeeds)
+        """
+        output_filename = self.node.get_option('output_filename')
+
+        # Check that folder content is as expected
+        files_retrieved = self.retrieved.list_object_names()
+        files_expected = [output_filename]
+        # Note: set(A) <= set(B) checks whether A is a subset of B
+        if not set(files_expected) <= set(files_retrieved):
+            self.logger.error(
+                f"Found files '{files_retrieved}', expected to find '{files_expected}'"
+            )
+            return self.exit_codes.ERROR_MISSING_OUTPUT_FILES
+
+        # check aiida.out content
+        self.logger.info(f"Parsing '{output_filename}'")
+        with self.retrieved.open(output_filename, 'r') as handle:
+            performance = parse_flexpart_log(handle)
+        with self.retrieved.open(output_filename, 'rb') as handle:
+            output_node = self.get_output_file(handle, output_filename, performance['completed'])
+        self.out('output_file', output_node)
+        self.out('performance', self.get_performance(performance))
+        if not performance['completed']:
+            return engine.ExitCode(1)
+
+        self.parse_nc_files(files_retrieved)
+        self.parse_header(kwargs.get('retrieved_temporary_folder'))
+        return engine.ExitCode(0)
+
+    def get_output_file(self, handle, output_filename, completed):
+        """
+        Store the log in full, or compacted according to the `log_storage` option.
+
+        Failed runs and logs below `log_full_size_kb` are always kept in full.
+        """
+        log_storage = self.node.get_option('log_storage') or 'full'
+        size = handle.seek(0, os.SEEK_END)
+        handle.seek(0)
+        if not completed or log_storage == 'full' or size <= self.node.get_option('log_full_size_kb') * 1024:
+            return orm.SinglefileData(file=handle)
+        buffer, suffix = compact_log(handle, log_storage, self.node.get_option('log_tail_kb'))
+        return orm.SinglefileData(file=buffer, filename=output_filename + suffix)
+
+    def get_performance(self, performance):
+        """Add the wall-clock time reported by the scheduler to the metrics parsed from the log."""
+        job_info = self.node.get_last_job_info()
+        wallclock = getattr(job_info, 'wallclock_time_seconds', None)
+        performance['wallclock_seconds'] = wallclock
+        performance['wallclock_per_simulated_hour'] = None
+        if wallclock and performance['simulated_hours']:
+            performance['wallclock_per_simulated_hour'] = wallclock / performance['simulated_hours']
+        return orm.Dict(performance)
+
+    def parse_nc_files(self, files_retrieved):
+        """
+        Register the `grid_time_*.nc` files as `NetCdfData` outputs.
+
+        Only the headers are read, the nodes point at the files in the remote working directory.
+        If the files were not retrieved, the headers are taken from the remote header probe.
+        """
+        remote_workdir = pathlib.Path(self.node.get_remote_workdir())
+        if 'nc_subset' in self.node.inputs:
+            # the retrieved files or headers are the ones of the reduced copies
+            remote_workdir /= NC_SUBSET_FOLDER
+        headers = {}
+        if NC_HEADERS_FILENAME in files_retrieved:
+            with self.retrieved.open(NC_HEADERS_FILENAME, 'r') as handle:
+                headers = parse_ncdump_headers(handle.read())
+        for filename in files_retrieved:
+            if filename.startswith('grid_time_') and filename.endswith('.nc'):
+                with self.retrieved.base.repository.as_path(filename) as path:
+                    headers[filename] = get_nc_header(path)
+
+        for filename, (nc_dimensions, global_att) in headers.items():
+            self.out(
+                f'nc_files.{pathlib.Path(filename).stem}',
+                NetCDF(
+                    filename,
+                    remote_path=str(remote_workdir / filename),
+                    computer=self.node.computer,
+                    g_att=global_att,
+                    nc_dimensions=nc_dimensions,
+                )
+            )
+
+    def parse_header(self, retrieved_temporary_folder):
+        """Attach the content of the binary `header` file, retrieved temporarily, as the `header` output."""
+        if retrieved_temporary_folder is None:
+            return
+        path = pathlib.Path(retrieved_temporary_folder) / 'header'
+        if not path.is_file():
+            return
+        try:
+            header = read_header(path)
+        except (ValueError, StopIteration) as exception:
+            self.logger.warning(f'Could not read the header file: {exception}')
+            return
+        self.out('header', orm.Dict(header.to_dict()))
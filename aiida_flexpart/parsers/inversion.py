@@ -4,11 +4,16 @@ Parsers provided by aiida_flexpart.
 
 Register parsers via the "aiida.parsers" entry point in setup.json.
 """
+import re
+import pathlib
+
 from aiida.engine import ExitCode
 from aiida.parsers.parser import Parser
 from aiida.plugins import CalculationFactory
 from aiida.common import exceptions
-from aiida.orm import SinglefileData
+from aiida.orm import ArrayData, SinglefileData
+
+from aiida_flexpart.utils import get_nc_arrays
 
 InversionCalculation = CalculationFactory('inversion.calc')
 
@@ -50,11 +55,34 @@ class InvesrionParser(Parser):
         # add output file
         self.logger.info(f"Parsing '{output_filename}'")
         with self.retrieved.open(output_filename, 'r') as handle:
-            content = handle.read()
+            completed = any('Congratulations' in line for line in handle)
+        with self.retrieved.open(output_filename, 'rb') as handle:
             output_node = SinglefileData(file=handle)
-            if 'Congratulations' not in content:
-                self.out('output_file', output_node)
-                return ExitCode(1)
-
         self.out('output_file', output_node)
+        if not completed:
+            return ExitCode(1)
+
+        self.parse_elris_files(files_retrieved)
         return ExitCode(0)
+
+    def parse_elris_files(self, files_retrieved):
+        """
+        Store the variables of the retrieved ELRIS NetCDF files (posterior fluxes,
+        uncertainties, residuals per site, ...) as `ArrayData` outputs, one per file.
+        """
+        for filename in files_retrieved:
+            if not filename.startswith('ELRIS'):
+                continue
+            if not filename.endswith('.nc'):
+                self.logger.warning(f"Skipping '{filename}', only NetCDF ELRIS files are parsed")
+                continue
+            with self.retrieved.base.repository.as_path(filename) as path:
+                arrays, units = get_nc_arrays(path)
+
+            array_node = ArrayData()
+            for name, values in arrays.items():
+                array_node.set_array(re.sub(r'\W', '_', name), values)
+            array_node.base.attributes.set('units', units)
+            array_node.base.attributes.set('filename', filename)
+            label = re.sub(r'\W', '_', pathlib.Path(filename).stem)
+            self.out(f'elris.{label}', array_node)
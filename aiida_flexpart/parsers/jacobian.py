@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Parsers provided by aiida_flexpart.
+
+Register parsers via the "aiida.parsers" entry point in setup.json.
+"""
+import pathlib
+import yaml
+
+from aiida import engine, parsers, plugins, common, orm
+
+JacobianCalculation = plugins.CalculationFactory('jacobian.assemble')
+
+
+class JacobianParser(parsers.Parser):
+    """
+    Parser class for parsing output of calculation.
+    """
+    def __init__(self, node):
+        """
+        Initialize Parser instance
+
+        Checks that the ProcessNode being passed was produced by a JacobianCalculation.
+
+        :param node: ProcessNode of calculation
+        :param type node: :class:`aiida.orm.ProcessNode`
+        """
+        super().__init__(node)
+        if not issubclass(node.process_class, JacobianCalculation):
+            raise common.ParsingError('Can only parse JacobianCalculation')
+
+    def parse(self, **kwargs):
+        """
+        Parse outputs, store results in database.
+
+        :returns: an exit code, if parsing fails (or nothing if parsing succeeds)
+        """
+        output_filename = self.node.get_option('output_filename')
+
+        # Check that folder content is as expected
+        files_retrieved = self.retrieved.list_object_names()
+        files_expected = [output_filename, 'jacobians.yaml']
+        # Note: set(A) <= set(B) checks whether A is a subset of B
+        if not set(files_expected) <= set(files_retrieved):
+            self.logger.error(
+                f"Found files '{files_retrieved}', expected to find '{files_expected}'"
+            )
+            return self.exit_codes.ERROR_MISSING_OUTPUT_FILES
+
+        with self.retrieved.open(output_filename, 'rb') as handle:
+            output_node = orm.SinglefileData(file=handle)
+        self.out('output_file', output_node)
+
+        with self.retrieved.open('jacobians.yaml', 'r') as handle:
+            jacobians = yaml.safe_load(handle)
+
+        remote_workdir = pathlib.Path(self.node.get_remote_workdir())
+        for site, jacobian in jacobians.items():
+            node = orm.RemoteData(remote_path=str(remote_workdir / jacobian['path']), computer=self.node.computer)
+            node.base.attributes.set('shape', jacobian['shape'])
+            self.out(f'jacobians.{site}', node)
+
+        return engine.ExitCode(0)
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Parsers provided by aiida_flexpart.
+
+Register parsers via the "aiida.parsers" entry point in setup.json.
+"""
+import pathlib
+
+from aiida import engine, parsers, plugins, common
+
+from aiida_flexpart.utils import parse_ncdump_headers, NC_HEADERS_FILENAME
+
+SparsifyFootprintsCalculation = plugins.CalculationFactory('footprints.sparsify')
+NetCDF = plugins.DataFactory('netcdf.data')
+
+# attributes describing the file itself, the others (site, month...) are passed on to the sparse copy
+FILE_ATTRIBUTES = ('remote_path', 'filename', 'global_attributes', 'dimensions')
+
+
+class SparsifyFootprintsParser(parsers.Parser):
+    """
+    Parser class for parsing output of calculation.
+
+    Also used for the calculations writing a converted copy of each input file as `<key>.nc`.
+    """
+    calculation_class = SparsifyFootprintsCalculation
+
+    def __init__(self, node):
+        """
+        Initialize Parser instance
+
+        Checks that the ProcessNode being passed was produced by a `calculation_class` calculation.
+
+        :param node: ProcessNode of calculation
+        :param type node: :class:`aiida.orm.ProcessNode`
+        """
+        super().__init__(node)
+        if not issubclass(node.process_class, self.calculation_class):
+            raise common.ParsingError(f'Can only parse {self.calculation_class.__name__}')
+
+    def parse(self, **kwargs):
+        """
+        Parse outputs, store results in database.
+
+        :returns: an exit code, if parsing fails (or nothing if parsing succeeds)
+        """
+        files_retrieved = self.retrieved.list_object_names()
+        if NC_HEADERS_FILENAME not in files_retrieved:
+            self.logger.error(
+                f"Found files '{files_retrieved}', expected to find '{NC_HEADERS_FILENAME}'"
+            )
+            return self.exit_codes.ERROR_MISSING_OUTPUT_FILES
+
+        with self.retrieved.open(NC_HEADERS_FILENAME, 'r') as handle:
+            headers = parse_ncdump_headers(handle.read())
+
+        remote_workdir = pathlib.Path(self.node.get_remote_workdir())
+        for key, remote in self.node.inputs.remotes.items():
+            if f'{key}.nc' not in headers:
+                self.logger.error(f"No output file for '{key}'")
+                return self.exit_codes.ERROR_MISSING_OUTPUT_FILES
+            nc_dimensions, global_att = headers[f'{key}.nc']
+            other = {
+                name: value for name, value in remote.base.attributes.all.items() if name not in FILE_ATTRIBUTES
+            }
+            self.out(
+                f'nc_files.{key}',
+                NetCDF(
+                    f'{key}.nc',
+                    remote_path=str(remote_workdir / f'{key}.nc'),
+                    computer=self.node.computer,
+                    g_att=global_att,
+                    nc_dimensions=nc_dimensions,
+                    other=other,
+                )
+            )
+
+        return engine.ExitCode(0)
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Parsers provided by aiida_flexpart.
+
+Register parsers via the "aiida.parsers" entry point in setup.json.
+"""
+import pathlib
+
+from aiida import engine, parsers, plugins, common
+
+from aiida_flexpart.utils import parse_ncdump_headers, NC_HEADERS_FILENAME
+
+SubsetObservationsCalculation = plugins.CalculationFactory('observations.subset')
+NetCDF = plugins.DataFactory('netcdf.data')
+
+
+class SubsetObservationsParser(parsers.Parser):
+    """
+    Parser class for parsing output of calculation.
+    """
+    def __init__(self, node):
+        """
+        Initialize Parser instance
+
+        Checks that the ProcessNode being passed was produced by a SubsetObservationsCalculation.
+
+        :param node: ProcessNode of calculation
+        :param type node: :class:`aiida.orm.ProcessNode`
+        """
+        super().__init__(node)
+        if not issubclass(node.process_class, SubsetObservationsCalculation):
+            raise common.ParsingError('Can only parse SubsetObservationsCalculation')
+
+    def parse(self, **kwargs):
+        """
+        Parse outputs, store results in database.
+
+        :returns: an exit code, if parsing fails (or nothing if parsing succeeds)
+        """
+        files_retrieved = self.retrieved.list_object_names()
+        if NC_HEADERS_FILENAME not in files_retrieved:
+            self.logger.error(
+                f"Found files '{files_retrieved}', expected to find '{NC_HEADERS_FILENAME}'"
+            )
+            return self.exit_codes.ERROR_MISSING_OUTPUT_FILES
+
+        with self.retrieved.open(NC_HEADERS_FILENAME, 'r') as handle:
+            headers = parse_ncdump_headers(handle.read())
+
+        observations = self.node.inputs.observations
+        missing = [key for key in observations if f'{key}.nc' not in headers]
+        if missing:
+            self.logger.error(f"No observations subset for '{missing}'")
+            return self.exit_codes.ERROR_MISSING_OUTPUT_FILES
+
+        remote_workdir = pathlib.Path(self.node.get_remote_workdir())
+        for key, source in observations.items():
+            nc_dimensions, global_att = headers[f'{key}.nc']
+            self.out(
+                f'observations.{key}',
+                NetCDF(
+                    f'{key}.nc',
+                    remote_path=str(remote_workdir / f'{key}.nc'),
+                    computer=self.node.computer,
+                    g_att=global_att,
+                    nc_dimensions=nc_dimensions,
+                    other={
+                        'source_uuid': source.uuid,
+                        'dtm_start': self.node.inputs.dtm_start.value,
+                        'dtm_end': self.node.inputs.dtm_end.value,
+                    },
+                )
+            )
+
+        return engine.ExitCode(0)
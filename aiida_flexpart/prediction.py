@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Prediction of the walltime and memory of FLEXPART calculations from the finished ones.
+
+The cost of a run is driven by the number of particle time steps: the particles
+(locations, releases and particles per release) times the integration time divided
+by the synchronisation interval, which also tells the meteorological models apart.
+For each calculation class, the logarithm of the runtime is fitted linearly against
+the logarithm of the particle steps, and the logarithm of the peak memory against
+the logarithm of the number of particles. The requests are the predictions plus
+`n_sigma` residual standard deviations, times a safety margin.
+
+The runtime is the wall-clock time reported by the scheduler, the peak memory is the
+`MaxRSS` of the detailed job information (SLURM). Calculations without it are only
+used for the runtime.
+"""
+import re
+import math
+import dataclasses
+
+import numpy
+from aiida import orm
+
+# units of the sacct memory fields, in KB
+_MEMORY_UNITS = {'': 1 / 1024, 'K': 1, 'M': 1024, 'G': 1024**2, 'T': 1024**3}
+_MEMORY_PATTERN = re.compile(r'^([\d.]+)([KMGT]?)$')
+
+
+def get_features(command, locations, release_settings):
+    """Features of a calculation from its `command`, `locations` and `release_settings` dictionaries."""
+    n_releases = max(1, command['release_duration'] // command['release_chunk'])
+    n_particles = len(locations) * n_releases * release_settings['particles_per_release']
+    integration_time = command['age_class']
+    return {
+        'n_locations': len(locations),
+        'n_particles': n_particles,
+        'integration_hours': integration_time / 3600,
+        'synchronisation_interval': command['synchronisation_interval'],
+        'particle_steps': n_particles * integration_time / command['synchronisation_interval'],
+    }
+
+
+def parse_max_rss(detailed_job_info):
+    """Largest `MaxRSS` (KB) of the job steps in the `sacct` output of the detailed job information, or None."""
+    lines = [line for line in (detailed_job_info or {}).get('stdout', '').splitlines() if '|' in line]
+    if not lines:
+        return None
+    header = lines[0].split('|')
+    if 'MaxRSS' not in header:
+        return None
+    column = header.index('MaxRSS')
+    values = []
+    for line in lines[1:]:
+        fields = line.split('|')
+        match = _MEMORY_PATTERN.match(fields[column]) if column < len(fields) else None
+        if match:
+            values.append(float(match.group(1)) * _MEMORY_UNITS[match.group(2)])
+    return max(values) if values else None
+
+
+def get_history(calculation_class, limit=500):
+    """Features, runtime (s) and peak memory (KB) of the latest successful calculations of a class.
+
+    The job information and the `model_settings` inputs are projected by a single query.
+    """
+    query = orm.QueryBuilder()
+    query.append(calculation_class, tag='calculation', filters={'attributes.exit_status': 0},
+                 project=['attributes.last_job_info', 'attributes.detailed_job_info'])
+    for name in ('command', 'locations', 'release_settings'):
+        query.append(orm.Dict, with_outgoing='calculation', edge_filters={'label': f'model_settings__{name}'},
+                     project='attributes')
+    query.order_by({'calculation': {'ctime': 'desc'}})
+    query.limit(limit)
+
+    samples = []
+    for job_info, detailed_job_info, command, locations, release_settings in query.iterall():
+        runtime = (job_info or {}).get('wallclock_time_seconds')
+        if not runtime:
+            continue
+        try:
+            features = get_features(command, locations, release_settings)
+        except (KeyError, TypeError, ZeroDivisionError):
+            continue
+        features['runtime'] = runtime
+        features['memory'] = parse_max_rss(detailed_job_info)
+        samples.append(features)
+    return samples
+
+
+@dataclasses.dataclass
+class LogLinearFit:
+    """Fit of log(y) = intercept + slope * log(x), with the standard deviation of the residuals."""
+    intercept: float
+    slope: float
+    sigma: float
+    n_samples: int
+
+    @classmethod
+    def from_samples(cls, x, y):
+        """Least squares fit, the slope is zero when all the `x` are the same."""
+        log_x, log_y = numpy.log(x), numpy.log(y)
+        if numpy.ptp(log_x) > 0:
+            slope, intercept = numpy.polyfit(log_x, log_y, 1)
+        else:
+            slope, intercept = 0., log_y.mean()
+        residuals = log_y - (intercept + slope * log_x)
+        sigma = residuals.std(ddof=2) if len(x) > 2 else 0.
+        return cls(float(intercept), float(slope), float(sigma), len(x))
+
+    def predict(self, x, n_sigma=2.):
+        """Upper estimate of y, `n_sigma` standard deviations above the fit."""
+        return math.exp(self.intercept + self.slope * math.log(x) + n_sigma * self.sigma)
+
+
+@dataclasses.dataclass
+class ResourcePredictor:
+    """Runtime and memory models of a calculation class, fitted on its history."""
+    runtime: LogLinearFit = None
+    memory: LogLinearFit = None
+
+    @classmethod
+    def from_history(cls, samples, min_samples=5):
+        """Fit the models with at least `min_samples` calculations each, otherwise they are left out."""
+        predictor = cls()
+        runtimes = [(i['particle_steps'], i['runtime']) for i in samples if i['particle_steps'] > 0]
+        if len(runtimes) >= min_samples:
+            predictor.runtime = LogLinearFit.from_samples(*map(numpy.array, zip(*runtimes)))
+        memories = [(i['n_particles'], i['memory']) for i in samples if i['n_particles'] > 0 and i['memory']]
+        if len(memories) >= min_samples:
+            predictor.memory = LogLinearFit.from_samples(*map(numpy.array, zip(*memories)))
+        return predictor
+
+    def predict(self, features, n_sigma=2.):
+        """Predicted runtime (s) and peak memory (KB), None for the models without enough history."""
+        runtime = self.runtime.predict(features['particle_steps'], n_sigma) if self.runtime else None
+        memory = self.memory.predict(features['n_particles'], n_sigma) if self.memory else None
+        return runtime, memory
+
+
+def predict_options(calculation_class, model_settings, options, margin=1.5, n_sigma=2., min_samples=5,
+                    min_walltime=600, max_walltime=None):
+    """Options of a calculation with `max_wallclock_seconds` and `max_memory_kb` predicted from the history.
+
+    :param model_settings: the `model_settings` inputs of the calculation (`command`, `locations` and
+        `release_settings` as `Dict` nodes).
+    :param options: options of the calculation, returned unchanged for the quantities without enough history.
+    :param margin: safety factor applied to the predictions.
+    :param min_walltime: lower bound of the requested walltime, in seconds.
+    :param max_walltime: optional upper bound of the requested walltime, e.g. the limit of the queue.
+    """
+    options = dict(options)
+    features = get_features(model_settings['command'].get_dict(), model_settings['locations'].get_dict(),
+                            model_settings['release_settings'].get_dict())
+    predictor = ResourcePredictor.from_history(get_history(calculation_class), min_samples)
+    runtime, memory = predictor.predict(features, n_sigma)
+    if runtime is not None:
+        walltime = max(min_walltime, math.ceil(margin * runtime))
+        options['max_wallclock_seconds'] = min(walltime, max_walltime) if max_walltime else walltime
+    if memory is not None:
+        options['max_memory_kb'] = math.ceil(margin * memory)
+    return options
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Reader of the native binary gridded FLEXPART output (`grid_time_*`, `grid_conc_*`).
+
+Without NetCDF output, FLEXPART writes one Fortran unformatted file per output time
+and species (`grid_time_YYYYMMDDHHMMSS_001`). After the time of the output (`itime`),
+each release point and age class holds the wet deposition, the dry deposition and
+the 3-d field, each as four records::
+
+    n_runs, indices(1:n_runs), n_values, values(1:n_values)
+
+The deposition records are written in backward runs too, with zero counts. Only
+the cells above a threshold are written. They are grouped in runs of consecutive
+cells (x fastest, then y, then z counted from 1), `indices` holds the flat index of the
+first cell of each run and the sign of the values flips from one run to the next.
+:func:`decode_sparse` expands the runs with numpy operations only.
+
+:func:`to_netcdf` converts the files of a run to the NetCDF conventions of the plugin,
+the module can be run on the remote after FLEXPART, see :func:`main`.
+"""
+import os
+import re
+import glob
+import datetime
+import argparse
+import tempfile
+
+import numpy
+import netCDF4
+from scipy import sparse
+
+from .header import split_records, read_header
+from ..footprints import sparsify
+from ..footprints.regridding import get_centres
+
+# fields of each release point and age class, in the order of the records
+FIELDS = ('wet', 'dry', 'concentration')
+
+GRID_FILE_PATTERN = re.compile(r'^(grid_(?:time|conc)_(?:nest_)?)(\d{14})_(\d{3})$')
+
+
+def decode_sparse(indices, values, size, offset=0):
+    """Dense array of `size` cells from the run-length encoded `indices` and sign-alternating `values`.
+
+    :param offset: flat index of the first cell, subtracted from `indices`.
+    """
+    dense = numpy.zeros(size, dtype='f4')
+    if not values.size:
+        return dense
+    starts = numpy.flatnonzero(numpy.r_[True, numpy.signbit(values[1:]) != numpy.signbit(values[:-1])])
+    run = numpy.repeat(numpy.arange(starts.size), numpy.diff(numpy.r_[starts, values.size]))
+    cells = indices[run] - offset + numpy.arange(values.size) - starts[run]
+    dense[cells] = numpy.abs(values)
+    return dense
+
+
+class GridFile:
+    """Binary output file of one output time and species.
+
+    The deposition fields of backward runs are read as zeros.
+
+    :param path: path of the file.
+    :param header: :class:`aiida_flexpart.readers.header.Header` of the run, by default the
+        `header` (or `header_nest` for nested output) file next to `path`.
+    """
+
+    def __init__(self, path, header=None):
+        self.path = str(path)
+        if header is None:
+            nest = '_nest_' in os.path.basename(self.path)
+            header = read_header(os.path.join(os.path.dirname(self.path), 'header_nest' if nest else 'header'))
+        self.header = header
+
+        records, byteorder = split_records(numpy.fromfile(self.path, dtype='u1'))
+        self._i4 = numpy.dtype('i4').newbyteorder(byteorder)
+        self._f4 = numpy.dtype('f4').newbyteorder(byteorder)
+        self.itime = int(records[0].view(self._i4)[0])
+        self._records = records[1:]
+
+        self.n_points = header.maxpointspec_act
+        self.n_ages = header.lage.size
+        expected = 4 * len(FIELDS) * self.n_points * self.n_ages
+        if len(self._records) != expected:
+            raise ValueError(f'expected {expected} records after the time in {self.path}, '
+                             f'found {len(self._records)}')
+
+    @property
+    def time(self):
+        """Date of the output."""
+        return self.header.start + datetime.timedelta(seconds=self.itime)
+
+    def _shape(self, field):
+        shape = (self.header.numygrid, self.header.numxgrid)
+        return (self.header.outheight.size,) + shape if field == 'concentration' else shape
+
+    def _block(self, point, age, field):
+        """Indices and values of one release point, age class and field."""
+        position = 4 * ((point * self.n_ages + age) * len(FIELDS) + FIELDS.index(field))
+        indices = self._records[position + 1].view(self._i4)
+        values = self._records[position + 3].view(self._f4)
+        return indices, values
+
+    def read(self, field='concentration'):
+        """Dense array (nageclass, pointspec, [height,] latitude, longitude) of a field."""
+        shape = self._shape(field)
+        size = int(numpy.prod(shape))
+        # the vertical index of the 3-d field starts at 1
+        offset = self.header.numxgrid * self.header.numygrid if field == 'concentration' else 0
+        result = numpy.zeros((self.n_ages, self.n_points) + shape, dtype='f4')
+        for point in range(self.n_points):
+            for age in range(self.n_ages):
+                indices, values = self._block(point, age, field)
+                result[age, point] = decode_sparse(indices, values, size, offset).reshape(shape)
+        return result
+
+    def read_sparse(self, field='concentration'):
+        """CSR matrix (nageclass * pointspec, cells) of a field, with the rows ordered as age class, release point."""
+        shape = self._shape(field)
+        size = int(numpy.prod(shape))
+        offset = self.header.numxgrid * self.header.numygrid if field == 'concentration' else 0
+        rows = []
+        for age in range(self.n_ages):
+            for point in range(self.n_points):
+                rows.append(sparse.csr_matrix(decode_sparse(*self._block(point, age, field), size, offset)))
+        return sparse.vstack(rows, format='csr')
+
+
+def find_grid_files(directory='.'):
+    """Binary output files of a run directory, grouped by prefix and species and sorted by time."""
+    groups = {}
+    for path in sorted(glob.glob(os.path.join(directory, 'grid_*'))):
+        match = GRID_FILE_PATTERN.match(os.path.basename(path))
+        if match:
+            prefix, _, species = match.groups()
+            groups.setdefault((prefix, int(species)), []).append(path)
+    return groups
+
+
+def to_netcdf(paths, out_path, header=None, variable='spec001_mr', is_sparse=False):
+    """Convert the binary files of one species (one file per output time) to a NetCDF file.
+
+    The 3-d field is written as `variable` (nageclass, pointspec, time, height, latitude, longitude),
+    like the NetCDF output of FLEXPART. With `is_sparse` the footprints are stored sparse, see
+    :mod:`aiida_flexpart.footprints.sparsify`.
+    """
+    files = sorted((GridFile(path, header) for path in paths), key=lambda grid_file: grid_file.itime)
+    header = files[0].header
+    if is_sparse:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            dense_path = os.path.join(tmpdir, 'dense.nc')
+            to_netcdf(paths, dense_path, header, variable)
+            sparsify.to_sparse(dense_path, out_path)
+        return len(files)
+
+    longitude, latitude = get_centres(header.outgrid)
+    with netCDF4.Dataset(str(out_path), mode='w', format='NETCDF4') as nc_file:
+        nc_file.setncatts({
+            'title': 'FLEXPART model output',
+            'source': header.version,
+            'history': f'{datetime.datetime.now():%Y-%m-%d %H:%M} created from the binary output',
+            'ibdate': f'{header.start:%Y%m%d}',
+            'ibtime': f'{header.start:%H%M%S}',
+            'loutstep': header.loutstep,
+            'loutaver': header.loutaver,
+            'loutsample': header.loutsample,
+        })
+        for name, size in (('time', None), ('longitude', longitude.size), ('latitude', latitude.size),
+                           ('height', header.outheight.size), ('pointspec', header.maxpointspec_act),
+                           ('nageclass', header.lage.size)):
+            nc_file.createDimension(name, size)
+        for name, values, units in (('longitude', longitude, 'degrees_east'), ('latitude', latitude, 'degrees_north'),
+                                    ('height', header.outheight, 'meters')):
+            coordinate = nc_file.createVariable(name, 'f4', (name,))
+            coordinate.units = units
+            coordinate[:] = values
+        time = nc_file.createVariable('time', 'i4', ('time',))
+        time.units = f'seconds since {header.start:%Y-%m-%d %H:%M}'
+        field = nc_file.createVariable(variable, 'f4',
+                                       ('nageclass', 'pointspec', 'time', 'height', 'latitude', 'longitude'),
+                                       zlib=True, complevel=4,
+                                       chunksizes=(1, 1, 1) + (header.outheight.size, latitude.size, longitude.size))
+        for index, grid_file in enumerate(files):
+            time[index] = grid_file.itime
+            field[:, :, index] = grid_file.read('concentration')
+    return len(files)
+
+
+def main(argv=None):
+    """Convert the binary output of a run directory to one NetCDF file per prefix and species."""
+    parser = argparse.ArgumentParser(description='Convert the binary FLEXPART output to NetCDF.')
+    parser.add_argument('-d', '--directory', default='.', help='run directory')
+    parser.add_argument('--sparse', action='store_true', help='store the footprints sparse')
+    args = parser.parse_args(argv)
+
+    for (prefix, species), paths in find_grid_files(args.directory).items():
+        header = GridFile(paths[0]).header
+        suffix = '' if species == 1 else f'_{species:03d}'
+        out_path = os.path.join(args.directory, f'{prefix}{header.start:%Y%m%d%H%M%S}{suffix}.nc')
+        count = to_netcdf(paths, out_path, header, f'spec{species:03d}_mr', args.sparse)
+        print(f'{count} files -> {out_path}')
+
+
+if __name__ == '__main__':
+    main()
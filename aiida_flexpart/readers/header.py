@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Reader of the binary FLEXPART `header` file (and `header_nest`).
+
+The header is a Fortran unformatted sequential file written by `writeheader`. It is
+read at once with `numpy.fromfile` and split into records with their length markers.
+The records describe the start of the simulation, the output intervals, the output
+grid, the species, the release points, the model switches, the age classes and the
+orography of the output grid.
+
+Headers are memoized by (path, modification time, size), for local files with
+:func:`read_header` and for files on a remote computer with :func:`read_remote_header`,
+so that a run is read only once however many analyses use it.
+"""
+import os
+import datetime
+import tempfile
+import functools
+import dataclasses
+
+import numpy
+
+MARKER = 'i4'
+
+REMOTE_CACHE_SIZE = 128
+_REMOTE_CACHE = {}
+
+
+@dataclasses.dataclass
+class Header:
+    """Content of a FLEXPART header file, the times of the releases are in seconds from `start`."""
+    start: datetime.datetime
+    version: str
+    loutstep: int
+    loutaver: int
+    loutsample: int
+    outlon0: float
+    outlat0: float
+    numxgrid: int
+    numygrid: int
+    dxout: float
+    dyout: float
+    outheight: numpy.ndarray
+    species: list
+    maxpointspec_act: int
+    releases: dict
+    switches: dict
+    lage: numpy.ndarray
+    oro: numpy.ndarray = None
+
+    @property
+    def outgrid(self):
+        """Output grid, with the keys of the `outgrid` input of the calculations."""
+        return {
+            'longitude_of_output_grid': self.outlon0,
+            'latitude_of_output_grid': self.outlat0,
+            'number_of_grid_points_x': self.numxgrid,
+            'number_of_grid_points_y': self.numygrid,
+            'grid_distance_x': self.dxout,
+            'grid_distance_y': self.dyout,
+            'heights_of_levels': self.outheight.tolist(),
+        }
+
+    def to_dict(self):
+        """Compact JSON serializable dictionary, without the orography."""
+        return {
+            'start': self.start.isoformat(),
+            'version': self.version,
+            'loutstep': self.loutstep,
+            'loutaver': self.loutaver,
+            'loutsample': self.loutsample,
+            'outgrid': self.outgrid,
+            'species': self.species,
+            'maxpointspec_act': self.maxpointspec_act,
+            'releases': {key: value.tolist() for key, value in self.releases.items()},
+            'switches': self.switches,
+            'lage': self.lage.tolist(),
+        }
+
+
+def split_records(buffer):
+    """Split the content of a Fortran unformatted sequential file into records, the byte order is detected."""
+    for byteorder in ('<', '>'):
+        marker = numpy.dtype(MARKER).newbyteorder(byteorder)
+        length = int(buffer[:4].view(marker)[0]) if buffer.size >= 4 else -1
+        if 0 < length <= buffer.size - 8 and int(buffer[4 + length:8 + length].view(marker)[0]) == length:
+            break
+    else:
+        raise ValueError('not a Fortran unformatted sequential file')
+
+    records, position = [], 0
+    while position + 8 <= buffer.size:
+        length = int(buffer[position:position + 4].view(marker)[0])
+        records.append(buffer[position + 4:position + 4 + length])
+        position += length + 8
+    return records, byteorder
+
+
+def parse_header(buffer):
+    """Decode the content (array of bytes) of a header file."""
+    records, byteorder = split_records(buffer)
+    records = iter(records)
+    i2, i4, f4 = (numpy.dtype(kind).newbyteorder(byteorder) for kind in ('i2', 'i4', 'f4'))
+
+    def ints(record, count=None):
+        return record[:None if count is None else 4 * count].view(i4)
+
+    def text(record, offset=0):
+        return bytes(record[offset:]).decode('ascii', errors='replace').replace('\x00', '').strip()
+
+    record = next(records)
+    ibdate, ibtime = ints(record, 2)
+    version = text(record, 8)
+    loutstep, loutaver, loutsample = (int(i) for i in ints(next(records)))
+    record = next(records)
+    outlon0, outlat0 = record[:8].view(f4)
+    numxgrid, numygrid = record[8:16].view(i4)
+    dxout, dyout = record[16:24].view(f4)
+    record = next(records)
+    outheight = record[4:].view(f4).astype(float)
+    next(records)  # date of the simulation start again
+    n_fields, maxpointspec_act = (int(i) for i in ints(next(records)))
+
+    # three output fields per species: wet deposition, dry deposition and concentration
+    species = []
+    for _ in range(n_fields // 3):
+        next(records)  # wet deposition
+        next(records)  # dry deposition
+        species.append(text(next(records), 4))
+
+    numpoint = int(ints(next(records))[0])
+    releases = {key: [] for key in ('start', 'end', 'kindz', 'lon1', 'lat1', 'lon2', 'lat2', 'z1', 'z2',
+                                    'npart', 'name', 'xmass')}
+    for _ in range(numpoint):
+        record = next(records)
+        releases['start'].append(int(record[:4].view(i4)[0]))
+        releases['end'].append(int(record[4:8].view(i4)[0]))
+        # kindz is a 2 byte integer in some versions
+        releases['kindz'].append(int(record[8:].view(i4 if record.size == 12 else i2)[0]))
+        for key, value in zip(('lon1', 'lat1', 'lon2', 'lat2', 'z1', 'z2'), next(records).view(f4)):
+            releases[key].append(float(value))
+        releases['npart'].append(int(ints(next(records))[0]))
+        releases['name'].append(text(next(records)))
+        # the mass of each species is written three times
+        releases['xmass'].append([float(next(records).view(f4)[0]) for _ in range(n_fields)][::3])
+    releases = {key: numpy.array(value) for key, value in releases.items()}
+
+    switches = dict(zip(('method', 'lsubgrid', 'lconvection', 'ind_source', 'ind_receptor'),
+                        (int(i) for i in ints(next(records)))))
+    lage = ints(next(records))[1:].astype(int)
+    # the orography is written as one record per longitude, each with the latitudes
+    oro = [record.view(f4) for record in records]
+    if oro:
+        if len(oro) < numxgrid or any(column.size != numygrid for column in oro[:numxgrid]):
+            raise ValueError(f'expected {numxgrid} orography records of {numygrid} values')
+        oro = numpy.stack(oro[:numxgrid], axis=1).astype(float)
+    else:
+        oro = None
+
+    return Header(
+        start=datetime.datetime.strptime(f'{int(ibdate):08d}{int(ibtime):06d}', '%Y%m%d%H%M%S'),
+        version=version,
+        loutstep=loutstep,
+        loutaver=loutaver,
+        loutsample=loutsample,
+        outlon0=float(outlon0),
+        outlat0=float(outlat0),
+        numxgrid=int(numxgrid),
+        numygrid=int(numygrid),
+        dxout=float(dxout),
+        dyout=float(dyout),
+        outheight=outheight,
+        species=species,
+        maxpointspec_act=maxpointspec_act,
+        releases=releases,
+        switches=switches,
+        lage=lage,
+        oro=oro,
+    )
+
+
+@functools.lru_cache(maxsize=128)
+def _read_header(path, mtime, size):  # pylint: disable=unused-argument
+    return parse_header(numpy.fromfile(path, dtype='u1'))
+
+
+def read_header(path):
+    """Read a header file, memoized by path, modification time and size."""
+    stat = os.stat(path)
+    return _read_header(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def read_remote_header(transport, remote_path):
+    """Read a header file on the computer of an open `transport`, memoized by path, modification time and size.
+
+    Only the attributes of the file are fetched when the header is in the cache.
+    """
+    attributes = transport.get_attribute(remote_path)
+    key = (getattr(transport, 'hostname', None), remote_path, attributes.st_mtime, attributes.st_size)
+    if key not in _REMOTE_CACHE:
+        if len(_REMOTE_CACHE) >= REMOTE_CACHE_SIZE:
+            _REMOTE_CACHE.pop(next(iter(_REMOTE_CACHE)))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            local_path = os.path.join(tmpdir, 'header')
+            transport.getfile(remote_path, local_path)
+            _REMOTE_CACHE[key] = parse_header(numpy.fromfile(local_path, dtype='u1'))
+    return _REMOTE_CACHE[key]
+
+
+def get_remote_header(remote_folder, filename='header'):
+    """Header of a calculation from its remote working directory (`RemoteData`), see :func:`read_remote_header`."""
+    with remote_folder.get_authinfo().get_transport() as transport:
+        return read_remote_header(transport, os.path.join(remote_folder.get_remote_path(), filename))
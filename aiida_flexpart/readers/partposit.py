@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Reader of the FLEXPART particle dumps (`partposit_*`, `partposit_inst`).
+
+A dump is a Fortran unformatted sequential file: every record is framed by two
+4 byte markers holding its length. The first record is the time of the dump
+(`itime`), followed by one record per particle::
+
+    npoint, xlon, ylat, ztra, itramem, topo, pv, qv, rho, hmix, tr, tt, xmass(1:nspec)
+
+and a terminating record with ``npoint = -99999``. All the particle records have
+the same length, so the file is mapped with a structured `numpy.memmap` and the
+fields are exposed as views, without reading or copying the particles. The number
+of species and the byte order are detected from the first particle record.
+
+:func:`compact` drops the particles that a continuation run does not need, the
+module can be run on the remote, see :func:`main`.
+"""
+import os
+import argparse
+import itertools
+
+import numpy
+import yaml
+
+MARKER = 'i4'
+END_OF_PARTICLES = -99999
+
+PARTICLE_FIELDS = (
+    ('npoint', 'i4'),  # release point of the particle
+    ('xlon', 'f4'),
+    ('ylat', 'f4'),
+    ('ztra', 'f4'),  # height above ground
+    ('itramem', 'i4'),  # release time of the particle
+    ('topo', 'f4'),
+    ('pv', 'f4'),
+    ('qv', 'f4'),
+    ('rho', 'f4'),
+    ('hmix', 'f4'),
+    ('tr', 'f4'),
+    ('tt', 'f4'),
+)
+
+
+def particle_dtype(nspec, byteorder='<'):
+    """Structured dtype of a particle record, including its two record markers."""
+    fields = [('head', MARKER)] + list(PARTICLE_FIELDS) + [('xmass', 'f4', (nspec,)), ('tail', MARKER)]
+    return numpy.dtype([(name, numpy.dtype(kind).newbyteorder(byteorder), *shape)
+                        for name, kind, *shape in fields])
+
+
+def header_dtype(byteorder='<'):
+    """Structured dtype of the first record (time of the dump), including its two record markers."""
+    return numpy.dtype([('head', MARKER), ('itime', 'i4'), ('tail', MARKER)]).newbyteorder(byteorder)
+
+
+class PartpositFile:
+    """Particle dump mapped in memory.
+
+    :param path: path of the dump.
+    :param mode: mode of the `numpy.memmap`, 'r' (default) or 'r+' to modify the particles in place.
+    """
+
+    def __init__(self, path, mode='r'):
+        self.path = str(path)
+        self.byteorder = self._detect_byteorder()
+        header = numpy.fromfile(self.path, dtype=header_dtype(self.byteorder), count=1)[0]
+        self.itime = int(header['itime'])
+
+        marker = numpy.fromfile(self.path, dtype=numpy.dtype(MARKER).newbyteorder(self.byteorder),
+                                count=1, offset=header.dtype.itemsize)
+        n_fields = len(PARTICLE_FIELDS)
+        if not marker.size or marker[0] % 4 or marker[0] // 4 < n_fields:
+            raise ValueError(f'{self.path} is not a FLEXPART particle dump')
+        self.nspec = int(marker[0]) // 4 - n_fields
+        self.dtype = particle_dtype(self.nspec, self.byteorder)
+
+        size = os.path.getsize(self.path) - header.dtype.itemsize
+        if size % self.dtype.itemsize:
+            raise ValueError(f'{self.path} is truncated or has records of different lengths')
+        records = numpy.memmap(self.path, dtype=self.dtype, mode=mode, offset=header.dtype.itemsize)
+        if records.size and records[-1]['npoint'] == END_OF_PARTICLES:
+            records = records[:-1]
+        self.particles = records
+
+    def _detect_byteorder(self):
+        for byteorder in ('<', '>'):
+            marker = numpy.fromfile(self.path, dtype=numpy.dtype(MARKER).newbyteorder(byteorder), count=1)
+            if marker.size and marker[0] == 4:
+                return byteorder
+        raise ValueError(f'{self.path} is not a FLEXPART particle dump')
+
+    def __len__(self):
+        return self.particles.size
+
+    def __getitem__(self, field):
+        """View of a field of all the particles, e.g. `dump['ztra']`."""
+        return self.particles[field]
+
+    @property
+    def positions(self):
+        """Longitude, latitude and height of the particles, as three views of the dump."""
+        return self.particles['xlon'], self.particles['ylat'], self.particles['ztra']
+
+    @property
+    def release_points(self):
+        """Release point index of the particles."""
+        return self.particles['npoint']
+
+    @property
+    def masses(self):
+        """Mass of the particles per species, array (n_particles, nspec)."""
+        return self.particles['xmass']
+
+    def iter_chunks(self, chunk_size=1_000_000):
+        """Iterate over the particles by chunks of at most `chunk_size` records (views of the dump)."""
+        for start in range(0, len(self), chunk_size):
+            yield self.particles[start:start + chunk_size]
+
+    def validate(self):
+        """Check that all the record markers hold the record length, chunk by chunk."""
+        length = self.dtype.itemsize - 2 * numpy.dtype(MARKER).itemsize
+        for chunk in self.iter_chunks():
+            if (chunk['head'] != length).any() or (chunk['tail'] != length).any():
+                return False
+        return True
+
+
+def write_partposit(path, itime, particles, byteorder='<', nspec=None):
+    """Write a particle dump.
+
+    :param particles: structured array with the fields of :data:`PARTICLE_FIELDS` and `xmass`
+        (e.g. the particles of a :class:`PartpositFile`), or an iterable of such arrays
+        which are written one after the other. The record markers are set here.
+    :param nspec: number of species, by default that of the particles. Required to write a dump
+        without particles from an empty iterable.
+    :return: number of particles written.
+    """
+    chunks = iter([particles] if isinstance(particles, numpy.ndarray) else particles)
+    first = next(chunks, None)
+    if first is None:
+        if nspec is None:
+            raise ValueError('the species of the particles are unknown without any chunk of particles')
+        first = numpy.zeros(0, dtype=particle_dtype(nspec, byteorder))
+    elif nspec is None:
+        nspec = first.dtype['xmass'].shape[0] if first.dtype['xmass'].shape else 1
+    dtype = particle_dtype(nspec, byteorder)
+    length = dtype.itemsize - 2 * numpy.dtype(MARKER).itemsize
+
+    header = numpy.zeros(1, dtype=header_dtype(byteorder))
+    header['head'] = header['tail'] = 4
+    header['itime'] = itime
+
+    terminator = numpy.zeros(1, dtype=dtype)
+    terminator['npoint'] = terminator['itramem'] = END_OF_PARTICLES
+    for name, kind in PARTICLE_FIELDS:
+        if kind.startswith('f'):
+            terminator[name] = -9999.9
+    terminator['xmass'] = -9999.9
+
+    count = 0
+    with open(path, 'wb') as handle:
+        header.tofile(handle)
+        for chunk in itertools.chain([first], chunks):
+            records = numpy.zeros(chunk.size, dtype=dtype)
+            for name in dtype.names:
+                if name in ('head', 'tail'):
+                    records[name] = length
+                else:
+                    records[name] = chunk[name].reshape(records[name].shape)
+            records.tofile(handle)
+            count += chunk.size
+        terminator['head'] = terminator['tail'] = length
+        terminator.tofile(handle)
+    return count
+
+
+def select_particles(chunk, itime, min_mass=0., max_age=None, region=None, keep='outside'):
+    """Mask of the particles of a chunk that are kept by :func:`compact`."""
+    mask = chunk['xmass'].reshape(chunk.size, -1).sum(axis=1) > min_mass
+    if max_age is not None:
+        mask &= numpy.abs(itime - chunk['itramem'].astype('i8')) <= max_age
+    if region is not None:
+        lon_min, lon_max, lat_min, lat_max = region
+        inside = ((chunk['xlon'] >= lon_min) & (chunk['xlon'] <= lon_max) &
+                  (chunk['ylat'] >= lat_min) & (chunk['ylat'] <= lat_max))
+        mask &= ~inside if keep == 'outside' else inside
+    return mask
+
+
+def compact(in_path, out_path, min_mass=0., max_age=None, region=None, keep='outside', chunk_size=1_000_000):
+    """Write the particles of a dump that are still needed, e.g. by an offline nested run.
+
+    :param min_mass: particles whose total mass does not exceed `min_mass` are dropped.
+    :param max_age: particles older (in seconds) than `max_age` at the time of the dump are dropped.
+    :param region: optional box [lon_min, lon_max, lat_min, lat_max].
+    :param keep: 'outside' to keep only the particles outside of `region`, 'inside' for the opposite.
+    :return: dictionary with the number of particles and the size of the dump, before and after.
+    """
+    if keep not in ('inside', 'outside'):
+        raise ValueError(f"keep should be 'inside' or 'outside', not '{keep}'")
+    dump = PartpositFile(in_path)
+    n_out = write_partposit(
+        out_path, dump.itime,
+        (chunk[select_particles(chunk, dump.itime, min_mass, max_age, region, keep)]
+         for chunk in dump.iter_chunks(chunk_size)),
+        dump.byteorder,
+        dump.nspec,
+    )
+    return {
+        'itime': dump.itime,
+        'n_particles_in': len(dump),
+        'n_particles_out': n_out,
+        'size_in': os.path.getsize(in_path),
+        'size_out': os.path.getsize(out_path),
+    }
+
+
+def main(argv=None):
+    """Compact a particle dump, the summary is written as yaml."""
+    parser = argparse.ArgumentParser(description='Compact a FLEXPART particle dump.')
+    parser.add_argument('-i', '--input', default='partposit_previous', help='particle dump to read')
+    parser.add_argument('-o', '--output', default='partposit_inst', help='particle dump to write')
+    parser.add_argument('-s', '--summary', default='compaction.yaml', help='yaml summary file')
+    parser.add_argument('--min-mass', type=float, default=0., help='drop the particles without more mass')
+    parser.add_argument('--max-age', type=int, default=None, help='drop the particles older than this (s)')
+    parser.add_argument('--region', type=float, nargs=4, default=None,
+                        metavar=('LON_MIN', 'LON_MAX', 'LAT_MIN', 'LAT_MAX'), help='region of the particles')
+    parser.add_argument('--keep', choices=('inside', 'outside'), default='outside',
+                        help='keep the particles inside or outside of the region')
+    args = parser.parse_args(argv)
+
+    summary = compact(args.input, args.output, args.min_mass, args.max_age, args.region, args.keep)
+    with open(args.summary, 'w', encoding='utf-8') as handle:
+        yaml.dump(summary, handle)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,23 @@
 # -*- coding: utf-8 -*-
 """Utilties to convert between python and fortran data types and formats."""
 
+import io
+import os
+import re
+import gzip
+import shutil
 import numbers
 import datetime
 import importlib
 import numpy
 import jinja2
+import netCDF4
+
+from .footprints import sparsify
+
+NC_HEADERS_FILENAME = 'nc_headers.txt'
+NC_SUBSET_FOLDER = 'subset'
+LOG_STORAGE_MODES = ('full', 'gzip', 'tail')
 
 
 def conv_to_fortran(val, quote_strings=True):
@@ -237,3 +249,221 @@ def get_simulation_period(date, age_class_time, release_duration,
                                       '%Y%m%d%H'), datetime.datetime.strftime(
                                           simulation_beginning_date,
                                           '%Y%m%d%H')
+
+
+def get_num_cores(resources):
+    """Number of cores per machine in the resources requested from the scheduler."""
+    if resources.get('num_cores_per_machine'):
+        return resources['num_cores_per_machine']
+    return resources.get('num_mpiprocs_per_machine', 1) * resources.get('num_cores_per_mpiproc', 1)
+
+
+def get_nc_header(path):
+    """Read the dimensions and global attributes of a NetCDF file.
+
+    Only the header is accessed, the variables are never loaded.
+    """
+    with netCDF4.Dataset(str(path), mode='r') as nc_file:
+        nc_dimensions = {i: len(nc_file.dimensions[i]) for i in nc_file.dimensions}
+        global_att = {a: repr(nc_file.getncattr(a)) for a in nc_file.ncattrs()}
+    return nc_dimensions, global_att
+
+
+def get_nc_arrays(path):
+    """Read all the variables of a NetCDF file as numpy arrays, masked values of float variables become NaN.
+
+    Sparse footprints (see :mod:`aiida_flexpart.footprints.sparsify`) are returned dense.
+
+    :return: dictionary of arrays and dictionary of the units of the variables, keyed by variable name.
+    """
+    arrays, units = {}, {}
+    with netCDF4.Dataset(str(path), mode='r') as nc_file:
+        storage = sparsify.get_storage_variables(nc_file)
+        for name, variable in nc_file.variables.items():
+            if name in storage:
+                continue
+            if sparsify.is_sparse(nc_file, name):
+                values = sparsify.get_dense(nc_file, name)
+            else:
+                values = variable[:]
+            if numpy.ma.isMaskedArray(values) and values.dtype.kind == 'f':
+                values = values.filled(numpy.nan)
+            arrays[name] = numpy.ma.getdata(values)
+            if 'units' in variable.ncattrs():
+                units[name] = str(variable.getncattr('units'))
+    return arrays, units
+
+
+def get_nc_header_probe(pattern, headers_filename):
+    """Shell snippet that dumps the headers of the NetCDF files matching `pattern` into `headers_filename`."""
+    return f'for f in {pattern}; do [ -e "$f" ] && ncdump -h "$f"; done > {headers_filename}\n'
+
+
+def get_binary_conversion_command(python):
+    """Shell snippet converting the native binary output of FLEXPART in the working directory to NetCDF files.
+
+    :param python: python interpreter of the remote computer, with aiida-flexpart installed.
+    """
+    return f'{python} -m aiida_flexpart.readers.grid -d .\n'
+
+
+def get_nc_output_commands(options, nc_subset=None, pattern='grid_time_*.nc'):
+    """Shell snippet to append to the job and files to retrieve for the NetCDF output of FLEXPART.
+
+    The native binary output is converted first (option `binary_converter`), then the files are
+    reduced (`nc_subset`). Without `retrieve_nc_files` only the headers of the (reduced) files are
+    retrieved, otherwise the (reduced) files.
+
+    :param options: options of the calculation.
+    :param nc_subset: optional dictionary of :func:`get_nc_subset_command`.
+    :return: the shell snippet and the retrieve list.
+    """
+    append_text = ''
+    if options.binary_converter:
+        # the NetCDF files must exist before they are reduced or probed
+        append_text += get_binary_conversion_command(options.binary_converter)
+    if nc_subset:
+        append_text += get_nc_subset_command([pattern], nc_subset)
+        pattern = f'{NC_SUBSET_FOLDER}/{pattern}'
+    if not options.retrieve_nc_files:
+        append_text += get_nc_header_probe(pattern, NC_HEADERS_FILENAME)
+        return append_text, [NC_HEADERS_FILENAME, options.output_filename]
+    return append_text, [pattern, options.output_filename]
+
+
+def get_nc_subset_command(patterns, subset):
+    """Shell snippet that writes reduced copies of the NetCDF files matching `patterns` into `NC_SUBSET_FOLDER`.
+
+    :param patterns: list of glob patterns of the NetCDF files to subset.
+    :param subset: dictionary with the optional keys `variables`, the list of variables to keep
+        (coordinates are always kept), and `time`, the `[start, end]` or `[start, end, stride]`
+        indices of the output times to keep (both ends included).
+    """
+    options = ['-O']
+    if subset.get('variables'):
+        options.append('-v ' + ','.join(subset['variables']))
+    if subset.get('time'):
+        if not 2 <= len(subset['time']) <= 3 or not all(isinstance(i, int) for i in subset['time']):
+            raise ValueError('time should be a list of integers: [start, end] or [start, end, stride]')
+        options.append('-d time,' + ','.join(str(i) for i in subset['time']))
+    options = ' '.join(options)
+
+    command = f'mkdir -p {NC_SUBSET_FOLDER}\n'
+    for pattern in patterns:
+        command += f'for f in {pattern}; do [ -e "$f" ] && ncks {options} "$f" "{NC_SUBSET_FOLDER}/$f"; done\n'
+    return command
+
+
+def parse_ncdump_headers(text):
+    """Parse the output of ``ncdump -h`` for one or more NetCDF files.
+
+    :return: dictionary mapping the file names to their dimensions and global attributes,
+        in the same format as :func:`get_nc_header`.
+    """
+    headers = {}
+    section = None
+    statement = ''
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith('netcdf ') and stripped.endswith('{'):
+            nc_dimensions, global_att = {}, {}
+            headers[stripped[len('netcdf '):-1].strip() + '.nc'] = (nc_dimensions, global_att)
+            section = None
+        elif stripped in ('dimensions:', 'variables:', '// global attributes:', '}'):
+            section = stripped
+        elif section == 'dimensions:' and '=' in stripped:
+            name, value = (i.strip() for i in stripped.split('=', 1))
+            if value.startswith('UNLIMITED'):
+                # e.g. "UNLIMITED ; // (3 currently)"
+                value = value.split('(')[-1].split()[0]
+            nc_dimensions[name] = int(value.rstrip(' ;'))
+        elif section == '// global attributes:' and stripped:
+            # attribute values can span several lines, they are terminated by a ';'
+            statement += stripped
+            if not statement.endswith(';'):
+                continue
+            name, value = (i.strip() for i in statement[:-1].split('=', 1))
+            statement = ''
+            if value.startswith('"'):
+                # strings are split into several quoted chunks at their newlines
+                value = ''.join(re.findall(r'"((?:[^"\\]|\\.)*)"', value))
+                value = repr(value.replace('\\n', '\n').replace('\\"', '"'))
+            global_att[name.lstrip(':')] = value
+    return headers
+
+
+# FLEXPART progress lines, e.g. "   -3600 Seconds simulated:     12000 Particles:    Uncertainty: ..."
+# or " Simulated     1.0 hours (         3600 s),         12000 particles"
+_PROGRESS_PATTERNS = (
+    re.compile(r'^\s*(-?\d+)\s+Seconds simulated:\s+(\d+)\s+Particles'),
+    re.compile(r'Simulated\s+-?[\d.]+\s+hours\s+\(\s*(-?\d+)\s+s\),\s+(\d+)\s+particles'),
+)
+
+
+def parse_flexpart_log(handle, success_marker='CONGRATULATIONS'):
+    """Parse the FLEXPART standard output line by line.
+
+    :param handle: handle of the log file opened in text mode.
+    :return: dictionary with the completion status, the number of timesteps, the particle counts
+        over time (as `[seconds, particles]` pairs), the simulated hours and the warnings.
+    """
+    completed = False
+    particles = []
+    warnings = []
+    for line in handle:
+        if success_marker in line:
+            completed = True
+            continue
+        if 'WARNING' in line:
+            warning = line.strip()
+            if warning not in warnings:
+                warnings.append(warning)
+            continue
+        for pattern in _PROGRESS_PATTERNS:
+            match = pattern.search(line)
+            if match:
+                particles.append([abs(int(match.group(1))), int(match.group(2))])
+                break
+
+    return {
+        'completed': completed,
+        'n_timesteps': len(particles),
+        'simulated_hours': particles[-1][0] / 3600 if particles else 0.,
+        'max_particles': max((i[1] for i in particles), default=0),
+        'particles': particles,
+        'warnings': warnings,
+    }
+
+
+def validate_log_storage(value, _):
+    """Validate the `log_storage` option of the calculations."""
+    if value not in LOG_STORAGE_MODES:
+        return f"log_storage should be one of {', '.join(LOG_STORAGE_MODES)}, got '{value}'"
+    return None
+
+
+def compact_log(handle, log_storage, tail_kb):
+    """Compress a log file or keep only its tail.
+
+    :param handle: handle of the log file opened in binary mode.
+    :param log_storage: either `gzip` or `tail`.
+    :param tail_kb: size of the tail to keep, in KB.
+    :return: in-memory file with the compacted log and the suffix to add to its file name.
+    """
+    buffer = io.BytesIO()
+    if log_storage == 'gzip':
+        with gzip.GzipFile(fileobj=buffer, mode='wb') as gz_file:
+            shutil.copyfileobj(handle, gz_file)
+        suffix = '.gz'
+    elif log_storage == 'tail':
+        size = handle.seek(0, os.SEEK_END)
+        handle.seek(max(size - tail_kb * 1024, 0))
+        if handle.tell() > 0:
+            # start from the first complete line
+            handle.readline()
+        shutil.copyfileobj(handle, buffer)
+        suffix = '.tail'
+    else:
+        raise ValueError(f"log_storage should be one of 'full', 'gzip' or 'tail', got '{log_storage}'")
+    buffer.seek(0)
+    return buffer, suffix
@@ -2,11 +2,13 @@
 """Flexpart multi-dates WorkChain."""
 from aiida import engine, plugins, orm
 from aiida_flexpart.workflows.child_meteo_workflow import TransferMeteoWorkflow
+from aiida_flexpart.prediction import predict_options
 
 # plugins
 FlexpartCosmoCalculation = plugins.CalculationFactory("flexpart.cosmo")
 FlexpartIfsCalculation = plugins.CalculationFactory("flexpart.ifs")
 FlexpartPostCalculation = plugins.CalculationFactory("flexpart.post")
+CompactParticlesCalculation = plugins.CalculationFactory("particles.compact")
 
 # possible models
 cosmo_models = ["cosmo7", "cosmo1", "kenda1"]
@@ -25,6 +27,9 @@ class FlexpartSimWorkflow(engine.WorkChain):
         spec.input("fcosmo_code", valid_type=orm.AbstractCode)
         spec.input("fifs_code", valid_type=orm.AbstractCode)
         spec.input("post_processing_code", valid_type=orm.AbstractCode)
+        spec.input("compact_code", valid_type=orm.AbstractCode, required=False,
+                   help="Python code compacting the particle dump before the offline run, "
+                        "the dump is passed on unchanged without it.")
 
         # Basic Inputs
         spec.expose_inputs(TransferMeteoWorkflow)
@@ -65,6 +70,17 @@ class FlexpartSimWorkflow(engine.WorkChain):
         )
 
         # Others
+        spec.input(
+            "compact_settings",
+            valid_type=orm.Dict,
+            required=False,
+            help="Filters of the particle dump, see CompactParticlesCalculation. "
+                 "By default the particles older than the offline age class are dropped.",
+        )
+        spec.input("predict_resources",
+                   valid_type=orm.Bool,
+                   default=lambda: orm.Bool(False),
+                   help="Set the walltime and memory of the flexpart calculations from the finished ones.")
         spec.input("outgrid", valid_type=orm.Dict)
         spec.input("outgrid_nest", valid_type=orm.Dict, required=False)
         spec.input("species", valid_type=orm.RemoteData, required=True)
@@ -93,6 +109,11 @@ class FlexpartSimWorkflow(engine.WorkChain):
             include=["metadata.options"],
             namespace="flexpartpost",
         )
+        spec.expose_inputs(
+            CompactParticlesCalculation,
+            include=["metadata.options"],
+            namespace="compactparticles",
+        )
         spec.outputs.dynamic = True
 
         #exit codes
@@ -106,6 +127,10 @@ class FlexpartSimWorkflow(engine.WorkChain):
                 cls.run_cosmo_simulation,
                 cls.inspect_calculation
                 ),
+            engine.if_(cls.compact_particles)(
+                cls.run_compaction,
+                cls.inspect_compaction
+                ),
             engine.if_(cls.run_ifs)(
                 cls.run_ifs_simulation,
                 cls.inspect_calculation
@@ -132,12 +157,28 @@ class FlexpartSimWorkflow(engine.WorkChain):
             return True
         return False
     
+    def compact_particles(self):
+        """compact the particle dump of the main run before the offline run"""
+        return (
+            "compact_code" in self.inputs
+            and self.ctx.offline_integration_time > 0
+            and "calculations" in self.ctx
+            and self.run_ifs()
+        )
+
     def inspect_calculation(self):
         if not self.ctx.calculations[-1].is_finished_ok:
             self.report('ERROR calculation did not finish ok')
             return self.exit_codes.ERROR_CALCULATION_FAILED
         self.report('calculation successfull')
 
+    def inspect_compaction(self):
+        if not self.ctx.compaction.is_finished_ok:
+            self.report('ERROR particle compaction did not finish ok')
+            return self.exit_codes.ERROR_CALCULATION_FAILED
+        compaction = self.ctx.compaction.outputs.compaction
+        self.report(f"kept {compaction['n_particles_out']} of {compaction['n_particles_in']} particles")
+
     def setup(self):
 
         self.ctx.simulation_date = self.inputs.date.value
@@ -206,11 +247,32 @@ class FlexpartSimWorkflow(engine.WorkChain):
         # Walltime, memory, and resources.
         builder.metadata.description = "Test workflow to submit a flexpart calculation"
         builder.metadata.options = self.inputs.flexpartcosmo.metadata.options
+        if self.inputs.predict_resources:
+            builder.metadata.options = predict_options(
+                FlexpartCosmoCalculation, builder.model_settings, self.inputs.flexpartcosmo.metadata.options)
+            self.report(f"requesting {builder.metadata.options.max_wallclock_seconds} s")
 
         # Ask the workflow to continue when the results are ready and store them in the context
         running = self.submit(builder)
         self.to_context(calculations=engine.append_(running))
 
+    def run_compaction(self):
+        """Filter the particle dump of the main run to the particles needed by the offline run."""
+        self.report("compacting the particle dump")
+        builder = CompactParticlesCalculation.get_builder()
+        builder.code = self.inputs.compact_code
+        builder.parent_calc_folder = self.ctx.calculations[-1].outputs.remote_folder
+
+        settings = {"max_age": self.ctx.offline_integration_time * 3600}
+        if "compact_settings" in self.inputs:
+            settings.update(self.inputs.compact_settings.get_dict())
+        builder.settings = orm.Dict(settings)
+        builder.metadata.options = self.inputs.compactparticles.metadata.options
+
+        # kept apart from the calculations, post-processing expects the flexpart runs there
+        running = self.submit(builder)
+        return engine.ToContext(compaction=running)
+
     def run_ifs_simulation(self):
         """Run calculations for equation of state."""
         # Set up calculation.
@@ -226,9 +288,12 @@ class FlexpartSimWorkflow(engine.WorkChain):
             new_dict["age_class"] = self.ctx.offline_integration_time * 3600
             new_dict["dumped_particle_data"] = True
 
-            self.ctx.parent_calc_folder = self.ctx.calculations[
-                -1
-            ].outputs.remote_folder
+            if "compaction" in self.ctx:
+                self.ctx.parent_calc_folder = self.ctx.compaction.outputs.remote_folder
+            else:
+                self.ctx.parent_calc_folder = self.ctx.calculations[
+                    -1
+                ].outputs.remote_folder
             builder.parent_calc_folder = self.ctx.parent_calc_folder
             self.report(f"starting from: {self.ctx.parent_calc_folder}")
 
@@ -258,6 +323,10 @@ class FlexpartSimWorkflow(engine.WorkChain):
         # Walltime, memory, and resources.
         builder.metadata.description = "Test workflow to submit a flexpart calculation"
         builder.metadata.options = self.inputs.flexpartifs.metadata.options
+        if self.inputs.predict_resources:
+            builder.metadata.options = predict_options(
+                FlexpartIfsCalculation, builder.model_settings, self.inputs.flexpartifs.metadata.options)
+            self.report(f"requesting {builder.metadata.options.max_wallclock_seconds} s")
 
         # Ask the workflow to continue when the results are ready and store them in the context
         running = self.submit(builder)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""Sharded collection of sensitivities WorkChain."""
+from aiida import engine, plugins, orm
+
+CollectSensitivitiesCalculation = plugins.CalculationFactory('collect.sensitivities')
+NetCDF = plugins.DataFactory('netcdf.data')
+
+
+def make_shards(remote):
+    """
+    Partition the stashed remote folders by release site and month.
+
+    The keys of `remote` are the simulation date (YYYY_MM_DD) followed by the site,
+    the shards are keyed by `<site>_<YYYY>_<MM>`.
+    """
+    shards = {}
+    for key, value in remote.items():
+        shards.setdefault(f'{key[10:]}_{key[:7]}', {})[key] = value
+    return shards
+
+
+class CollectSensitivitiesWorkflow(engine.WorkChain):
+    """Collect the sensitivities of a campaign with one concurrent
+    CollectSensitivitiesCalculation per release site and month."""
+    @classmethod
+    def define(cls, spec):
+        """Specify inputs and outputs."""
+        super().define(spec)
+
+        spec.input('collect_code', valid_type=orm.AbstractCode)
+
+        #extras
+        spec.input('name', valid_type=str, non_db=True, required=False)
+
+        spec.input_namespace('remote', valid_type=orm.RemoteStashFolderData, required=True)
+        spec.input('model', valid_type=str, non_db=True, required=True)
+        spec.input('outgrid', valid_type=str, non_db=True, required=True)
+        spec.input('outgrid_n', valid_type=bool, non_db=True, required=True)
+
+        spec.expose_inputs(CollectSensitivitiesCalculation,
+                           include=['metadata.options'],
+                           namespace='collectsens')
+
+        spec.outputs.dynamic = True
+        spec.output_namespace('nc_files', valid_type=NetCDF, required=False, dynamic=True,
+                              help='Collected sensitivities of all the shards keyed by site and month.')
+
+        #exit codes
+        spec.exit_code(400, 'ERROR_CALCULATION_FAILED',
+                       'one or more collection shards did not finish successfully')
+
+        spec.outline(
+            cls.setup,
+            cls.run_collect,
+            cls.finalize,
+        )
+
+    def setup(self):
+        """Partition the remote folders into shards."""
+        self.ctx.shards = make_shards(self.inputs.remote)
+        self.report(f'collecting sensitivities in {len(self.ctx.shards)} shards')
+
+    def run_collect(self):
+        """Submit one collection per shard, all of them run concurrently."""
+        for shard, remote in self.ctx.shards.items():
+            builder = CollectSensitivitiesCalculation.get_builder()
+            builder.code = self.inputs.collect_code
+            builder.remote = remote
+            builder.model = self.inputs.model
+            builder.outgrid = self.inputs.outgrid
+            builder.outgrid_n = self.inputs.outgrid_n
+            if 'name' in self.inputs:
+                builder.name = self.inputs.name
+            builder.metadata.options = self.inputs.collectsens.metadata.options
+            builder.metadata.call_link_label = f'collect_{shard}'
+
+            running = self.submit(builder)
+            self.to_context(calculations=engine.append_(running))
+
+    def finalize(self):
+        """Output the collected sensitivities, fail if any shard failed."""
+        failed = [calc.pk for calc in self.ctx.calculations if not calc.is_finished_ok]
+        if failed:
+            self.report(f'collection shards {failed} did not finish ok')
+            return self.exit_codes.ERROR_CALCULATION_FAILED
+
+        for indx, calculation in enumerate(self.ctx.calculations):
+            self.out(f'calculation_{indx}_output_file',
+                     calculation.outputs.output_file)
+            if 'nc_files' in calculation.outputs:
+                for label, node in calculation.outputs.nc_files.items():
+                    self.out(f'nc_files.{label}', node)
+        return None
@@ -3,7 +3,7 @@ from aiida.plugins import DataFactory
 from aiida import orm
 from pathlib import Path
 import tempfile
-from netCDF4 import Dataset
+from aiida_flexpart.utils import get_nc_header
 
 NetCDF = DataFactory("netcdf.data")
 
@@ -26,6 +26,16 @@ def check(nc_file, version):
                 return False
     return True
 
+
+def is_registered(remote_path):
+    """
+    Checks if a NetCDF node pointing at the given remote path already exists,
+    e.g. because it was created by the parser of the FLEXPART calculation.
+    """
+    qb = orm.QueryBuilder()
+    qb.append(NetCDF, filters={"attributes.remote_path": str(remote_path)})
+    return qb.count() > 0
+
 @calcfunction
 def store(remote_dir, file, time_label):
     with tempfile.TemporaryDirectory() as td:
@@ -34,11 +44,7 @@ def store(remote_dir, file, time_label):
         remote_dir.getfile(remote_path, temp_path)
 
         # fill global attributes and dimensions
-        nc_file = Dataset(str(temp_path), mode="r")
-        nc_dimensions = {i: len(nc_file.dimensions[i]) for i in nc_file.dimensions}
-        global_att = {}
-        for a in nc_file.ncattrs():
-            global_att[a] = repr(nc_file.getncattr(a))
+        nc_dimensions, global_att = get_nc_header(temp_path)
 
         node = NetCDF(
             str(temp_path),
@@ -91,4 +97,6 @@ class InspectWorkflow(WorkChain):
         for _, i in self.ctx.dict_remote_data.items():
             for file in i.listdir():
                 if ".nc" in file:
+                    if is_registered(Path(i.get_remote_path()) / file):
+                        continue
                     store(i, file, self.inputs.time_label)
@@ -1,7 +1,12 @@
 from aiida import engine, plugins, orm
+from aiida_flexpart.calculations.consolidate import get_month
 from datetime import datetime
+import hashlib
+import json
 from dateutil.relativedelta import relativedelta
 
+NetCDF = plugins.DataFactory('netcdf.data')
+
 def make_date_range(start:datetime, 
                     end:datetime, 
                     chunk:str,
@@ -23,17 +28,87 @@ def transform(start:datetime,
     dtm_end = start+relativedelta(months=step+step*(chunk!=chunk_w))
     return datetime.strftime(dtm_start,'%Y-%m-%d'),datetime.strftime(dtm_end,'%Y-%m-%d')
 
+def select_window(remotes:dict,
+                  dtm_start:str,
+                  dtm_end:str)->dict:
+    """Keep the footprints of the months overlapping [dtm_start, dtm_end),
+    footprints without a month are always kept."""
+    start, end = dtm_start[:7].replace('-', ''), dtm_end[:7].replace('-', '')
+    selected = {}
+    for k, v in remotes.items():
+        month = get_month(v)
+        if month is None or start <= month < end:
+            selected[k] = v
+    return selected
+
+def find_observations_subset(observation, dtm_start:str, dtm_end:str):
+    """Look for an observations subset of the same source file and window produced earlier."""
+    qb = orm.QueryBuilder()
+    qb.append(NetCDF, filters={'attributes.source_uuid': observation.uuid,
+                               'attributes.dtm_start': dtm_start,
+                               'attributes.dtm_end': dtm_end})
+    result = qb.first()
+    return result[0] if result else None
+
+def get_fingerprint(inputs:dict)->str:
+    """
+    Hash of the effective inputs of an inversion chunk. The NetCDF files are identified by
+    their remote path and header, so that re-registered files do not change the fingerprint.
+    """
+    def describe(value):
+        if isinstance(value, NetCDF):
+            return [value.get_remote_path(),
+                    value.base.attributes.get('dimensions', None),
+                    value.base.attributes.get('global_attributes', None)]
+        if isinstance(value, orm.Dict):
+            return value.get_dict()
+        if isinstance(value, orm.BaseType):
+            return value.value
+        if isinstance(value, orm.Node):
+            return value.uuid
+        return {k: describe(v) for k, v in sorted(value.items())}
+
+    content = json.dumps(describe(inputs), sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+def next_wave(chains:list, limit:int)->list:
+    """
+    Indices of the sequences of chunks whose next chunk runs in the next wave, at most `limit`
+    (0 means no limit). The longest sequences go first, so that they all finish about together.
+    """
+    pending = sorted((i for i, chain in enumerate(chains) if chain), key=lambda i: -len(chains[i]))
+    return sorted(pending[:limit or None])
+
+def find_inversion(fingerprint:str):
+    """Look for a successful inversion chunk with the same fingerprint."""
+    qb = orm.QueryBuilder()
+    qb.append(InversionCalculation, filters={'extras.fingerprint': fingerprint,
+                                             'attributes.exit_status': 0})
+    result = qb.first()
+    return result[0] if result else None
+
 
 InversionCalculation = plugins.CalculationFactory("inversion.calc")
-NetCDF = plugins.DataFactory('netcdf.data')
+ConsolidateCalculation = plugins.CalculationFactory("footprints.consolidate")
+SubsetObservationsCalculation = plugins.CalculationFactory("observations.subset")
 
 class InversionWorkflow(engine.WorkChain):
+    """Run the inversion in chunks of the date range, optionally consolidating the footprints first."""
 
     @classmethod
     def define(cls, spec):
+        """Specify inputs and outputs."""
         super().define(spec)
 
         spec.input("inversion_code", valid_type=orm.AbstractCode)
+        spec.input("consolidate_code", valid_type=orm.AbstractCode, required=False,
+                   help="NCO ncrcat code. If given, the footprints of each site are first consolidated into a single file.")
+        spec.input("subset_obs_code", valid_type=orm.AbstractCode, required=False,
+                   help="NCO ncks code. If given, each chunk only gets the observations of its window.")
+        spec.input("consolidate_by_month", valid_type=orm.Bool, default=lambda: orm.Bool(False),
+                   help="Consolidate by site and month, each chunk then only reads the months of its window.")
+        spec.input("incremental", valid_type=orm.Bool, default=lambda: orm.Bool(False),
+                   help="Only run the chunks whose inputs changed since a previous run, reuse the others.")
 
         #extras
         spec.input('name', valid_type=str, non_db=True, required=False)
@@ -48,19 +123,57 @@ class InversionWorkflow(engine.WorkChain):
         spec.input('chunk',valid_type=orm.Str,required=True)
         spec.input('chunk_w',valid_type=orm.Str,required=True)
 
+        spec.input('max_concurrent',valid_type=orm.Int,default=lambda: orm.Int(0),
+                   help="""Maximum number of chunks running at the same time, 0 means no limit.
+                         The chunks are submitted in waves of at most this many chunks,
+                         the next wave is submitted once the whole previous one has finished.""")
+        spec.input('warm_start',valid_type=orm.Bool,default=lambda: orm.Bool(False),
+                   help="""Run the chunks in time order, each chunk starting from the posterior (ELRIS files)
+                         of the previous one. The chunks are split into `warm_start_sequences` consecutive
+                         sequences that run in parallel.""")
+        spec.input('warm_start_sequences',valid_type=orm.Int,default=lambda: orm.Int(1),
+                   help="""Number of independent sequences of warm started chunks. One sequence warm starts
+                         every chunk but runs them one after the other.""")
+
         spec.expose_inputs(InversionCalculation,
                            include=['metadata.options'],
                            namespace='inversioncalc')
+        spec.expose_inputs(ConsolidateCalculation,
+                           include=['metadata.options'],
+                           namespace='consolidatecalc')
+        spec.expose_inputs(SubsetObservationsCalculation,
+                           include=['metadata.options'],
+                           namespace='subsetobscalc')
 
         spec.outputs.dynamic = True
 
+        #exit codes
+        spec.exit_code(400, 'ERROR_CALCULATION_FAILED',
+                       'the previous calculation did not finish successfully')
+        spec.exit_code(401, 'ERROR_CHUNK_FAILED',
+                       'at least one inversion chunk did not finish successfully')
+
         spec.outline(
                 cls.setup,
-                cls.run_inv,
+                engine.if_(cls.consolidate)(
+                    cls.run_consolidate,
+                    cls.inspect_consolidate,
+                ),
+                cls.make_chunks,
+                engine.if_(cls.subset_observations)(
+                    cls.run_subset_obs,
+                    cls.inspect_subset_obs,
+                ),
+                engine.while_(cls.chunks_left)(
+                    cls.run_inv,
+                    cls.inspect_inv,
+                ),
                 cls.finalize,
             )
         
     def setup(self):
+        """Store the footprints and the inversion parameters in the context."""
+        self.ctx.remotes = dict(self.inputs.remotes)
         self.ctx.inv_params_dict = self.inputs.inv_params.get_dict()
         self.ctx.inv_params = self.inputs.inv_params.get_dict()
         self.ctx.inv_params.update({'chunk':self.inputs.chunk.value,
@@ -72,35 +185,168 @@ class InversionWorkflow(engine.WorkChain):
                     'inv_params':self.ctx.inv_params,
                  })
              
-    def run_inv(self):
+    def consolidate(self):
+        """Whether the footprints are consolidated first."""
+        return 'consolidate_code' in self.inputs
 
-        builder = InversionCalculation.get_builder()
-        builder.code = self.inputs.inversion_code
+    def run_consolidate(self):
+        """Concatenate the footprints of each site into a single file, read by all the chunks."""
+        builder = ConsolidateCalculation.get_builder()
+        builder.code = self.inputs.consolidate_code
         builder.remotes = self.inputs.remotes
-        builder.observations = self.inputs.observations
-        builder.chunk = self.inputs.chunk
-        builder.chunk_w = self.inputs.chunk_w
-        builder.metadata.options = self.inputs.inversioncalc.metadata.options
+        builder.by_month = self.inputs.consolidate_by_month
+        builder.metadata.options = self.inputs.consolidatecalc.metadata.options
+
+        running = self.submit(builder)
+        return engine.ToContext(consolidation=running)
 
+    def inspect_consolidate(self):
+        """Use the consolidated footprints for the chunks."""
+        if not self.ctx.consolidation.is_finished_ok:
+            self.report('ERROR footprint consolidation did not finish ok')
+            return self.exit_codes.ERROR_CALCULATION_FAILED
+        self.ctx.remotes = dict(self.ctx.consolidation.outputs.consolidated)
+        return None
+
+    def make_chunks(self):
+        """Split the date range in chunks, grouped in sequences of dependent chunks."""
         start = datetime.strptime(self.inputs.date_range.value[:10], '%Y-%m-%d')
         end = datetime.strptime(self.inputs.date_range.value[12:], '%Y-%m-%d')
         dates = make_date_range(start, end, self.inputs.chunk, self.inputs.chunk)
-    
+
+        chunks = []
         for (s,e) in dates.items():
-            
             dtm_start,dtm_end = transform(datetime.strptime(s, '%Y-%m-%d'),
-                                          self.inputs.chunk, 
+                                          self.inputs.chunk,
                                           self.inputs.chunk_w)
-            self.ctx.inv_params_dict.update({'dtm_start':dtm_start,
-                                            'dtm_end':dtm_end})
-            builder.start_date = orm.Str(s)
-            builder.end_date = orm.Str(e)
-            builder.inv_params = orm.Dict(self.ctx.inv_params_dict)
-            
+            chunks.append({'start_date':s, 'end_date':e,
+                           'dtm_start':dtm_start, 'dtm_end':dtm_end})
+
+        self.ctx.windows = sorted({(c['dtm_start'], c['dtm_end']) for c in chunks})
+        if self.inputs.warm_start:
+            n_chains = max(1, min(self.inputs.warm_start_sequences.value, len(chunks)))
+            size = -(-len(chunks)//n_chains)
+            self.ctx.chains = [chunks[i:i+size] for i in range(0, len(chunks), size)]
+        else:
+            self.ctx.chains = [[c] for c in chunks]
+        # pk of the last calculation of each sequence, and of the calculations of the current wave
+        self.ctx.previous = {}
+        self.ctx.wave = []
+        self.ctx.failed = []
+
+    def subset_observations(self):
+        """Whether each chunk only gets the observations of its window."""
+        return 'subset_obs_code' in self.inputs
+
+    def run_subset_obs(self):
+        """Slice the observations to the window of each chunk, reusing the subsets of earlier runs."""
+        # pks of the observations subsets, by window
+        self.ctx.observations = {}
+        for dtm_start, dtm_end in self.ctx.windows:
+            cached, missing = {}, {}
+            for k, v in self.inputs.observations.items():
+                subset = find_observations_subset(v, dtm_start, dtm_end)
+                if subset is None:
+                    missing[k] = v
+                else:
+                    cached[k] = subset.pk
+            self.ctx.observations[f'{dtm_start}_{dtm_end}'] = cached
+            if not missing:
+                continue
+
+            builder = SubsetObservationsCalculation.get_builder()
+            builder.code = self.inputs.subset_obs_code
+            builder.observations = missing
+            builder.dtm_start = orm.Str(dtm_start)
+            builder.dtm_end = orm.Str(dtm_end)
+            builder.metadata.options = self.inputs.subsetobscalc.metadata.options
+
             running = self.submit(builder)
+            self.to_context(subsets=engine.append_(running))
+
+    def inspect_subset_obs(self):
+        """Record the observations subsets of the windows."""
+        for calculation in self.ctx.get('subsets', []):
+            if not calculation.is_finished_ok:
+                self.report('ERROR observations subset did not finish ok')
+                return self.exit_codes.ERROR_CALCULATION_FAILED
+            window = f'{calculation.inputs.dtm_start.value}_{calculation.inputs.dtm_end.value}'
+            self.ctx.observations[window].update(
+                {k: v.pk for k, v in calculation.outputs.observations.items()})
+        return None
+
+    def chunks_left(self):
+        """Run waves of chunks until all the chunks ran or one of them failed."""
+        return not self.ctx.failed and any(self.ctx.chains)
+
+    def run_inv(self):
+        """Submit the next chunk of up to `max_concurrent` sequences, the whole wave is awaited."""
+        builder = InversionCalculation.get_builder()
+        builder.code = self.inputs.inversion_code
+        builder.chunk = self.inputs.chunk
+        builder.chunk_w = self.inputs.chunk_w
+        builder.metadata.options = self.inputs.inversioncalc.metadata.options
+
+        self.ctx.wave = []
+        # a sequence runs one chunk per wave
+        for indx in next_wave(self.ctx.chains, self.inputs.max_concurrent.value):
+            chunk = self.ctx.chains[indx].pop(0)
+
+            self.ctx.inv_params_dict.update({'dtm_start':chunk['dtm_start'],
+                                            'dtm_end':chunk['dtm_end']})
+            # only the footprints of the window matter for the reuse of a chunk
+            window_remotes = select_window(self.ctx.remotes, chunk['dtm_start'], chunk['dtm_end'])
+            builder.remotes = self.ctx.remotes
+            if self.inputs.consolidate_by_month:
+                # overlapping chunks share the monthly products by reference
+                builder.remotes = window_remotes
+            builder.observations = self.inputs.observations
+            if self.subset_observations():
+                builder.observations = {
+                    k: orm.load_node(pk)
+                    for k, pk in self.ctx.observations[f"{chunk['dtm_start']}_{chunk['dtm_end']}"].items()
+                }
+            builder.start_date = orm.Str(chunk['start_date'])
+            builder.end_date = orm.Str(chunk['end_date'])
+            builder.inv_params = orm.Dict(self.ctx.inv_params_dict)
+            builder.pop('prior', None)
+            if str(indx) in self.ctx.previous:
+                builder.prior = orm.load_node(self.ctx.previous[str(indx)]).outputs.retrieved
+
+            fingerprint = get_fingerprint({
+                'code': builder.code,
+                'remotes': window_remotes,
+                'observations': builder.observations,
+                'inv_params': builder.inv_params,
+                'start_date': builder.start_date,
+                'end_date': builder.end_date,
+                'chunk': builder.chunk,
+                'chunk_w': builder.chunk_w,
+                'prior': builder.get('prior', {}),
+            })
+            running = find_inversion(fingerprint) if self.inputs.incremental else None
+            if running is not None:
+                self.report(f"reusing inversion {running.pk} for chunk {chunk['start_date']}")
+            else:
+                running = self.submit(builder)
+                running.base.extras.set('fingerprint', fingerprint)
+            self.ctx.previous[str(indx)] = running.pk
+            self.ctx.wave.append(running.pk)
             self.to_context(calculations=engine.append_(running))
 
+    def inspect_inv(self):
+        """Check the chunks of the wave, no new wave is submitted once a chunk has failed."""
+        for pk in self.ctx.wave:
+            if not orm.load_node(pk).is_finished_ok:
+                self.report(f'ERROR inversion chunk {pk} did not finish ok')
+                self.ctx.failed.append(pk)
+
     def finalize(self):
+        """Output the files of the chunks, fail if any chunk failed."""
         for indx, calculation in enumerate(self.ctx.calculations):
-            self.out(f'calculation_{indx}_output_file',
-                     calculation.outputs.output_file)
\ No newline at end of file
+            if 'output_file' in calculation.outputs:
+                self.out(f'calculation_{indx}_output_file',
+                         calculation.outputs.output_file)
+        if self.ctx.failed:
+            return self.exit_codes.ERROR_CHUNK_FAILED
+        return None
\ No newline at end of file
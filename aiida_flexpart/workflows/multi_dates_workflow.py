@@ -3,6 +3,7 @@
 from aiida import engine, plugins, orm
 from aiida_shell import launch_shell_job
 from aiida_flexpart.utils import get_simulation_period
+from aiida_flexpart.prediction import predict_options
 
 #plugins
 FlexpartCosmoCalculation = plugins.CalculationFactory('flexpart.cosmo')
@@ -81,6 +82,10 @@ class FlexpartMultipleDatesWorkflow(engine.WorkChain):
         spec.input('gribdir', valid_type=orm.Str, required=True)
 
         #others
+        spec.input('predict_resources',
+                   valid_type=orm.Bool,
+                   default=lambda: orm.Bool(False),
+                   help='Set the walltime and memory of the flexpart calculations from the finished ones.')
         spec.input('outgrid', valid_type=orm.Dict)
         spec.input('outgrid_nest', valid_type=orm.Dict, required=False)
         spec.input('species', valid_type=orm.RemoteData, required=True)
@@ -310,6 +315,10 @@ class FlexpartMultipleDatesWorkflow(engine.WorkChain):
         # Walltime, memory, and resources.
         builder.metadata.description = 'Test workflow to submit a flexpart calculation'
         builder.metadata.options = self.inputs.flexpartcosmo.metadata.options
+        if self.inputs.predict_resources:
+            builder.metadata.options = predict_options(
+                FlexpartCosmoCalculation, builder.model_settings, self.inputs.flexpartcosmo.metadata.options)
+            self.report(f'requesting {builder.metadata.options.max_wallclock_seconds} s')
 
         # Ask the workflow to continue when the results are ready and store them in the context
         running = self.submit(builder)
@@ -365,6 +374,10 @@ class FlexpartMultipleDatesWorkflow(engine.WorkChain):
         # Walltime, memory, and resources.
         builder.metadata.description = 'Test workflow to submit a flexpart calculation'
         builder.metadata.options = self.inputs.flexpartifs.metadata.options
+        if self.inputs.predict_resources:
+            builder.metadata.options = predict_options(
+                FlexpartIfsCalculation, builder.model_settings, self.inputs.flexpartifs.metadata.options)
+            self.report(f'requesting {builder.metadata.options.max_wallclock_seconds} s')
 
         # Ask the workflow to continue when the results are ready and store them in the context
         running = self.submit(builder)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""Flexpart WorkChain splitting a long integration into segments that fit in the walltime."""
+import math
+
+from aiida import engine, plugins, orm
+
+# plugins
+FlexpartCosmoCalculation = plugins.CalculationFactory("flexpart.cosmo")
+FlexpartIfsCalculation = plugins.CalculationFactory("flexpart.ifs")
+
+
+class FlexpartSegmentedWorkflow(engine.WorkChain):
+    """Run a long FLEXPART simulation as a chain of shorter calculations.
+
+    The `age_class` of the command is the total integration time. Each segment integrates
+    up to `segment_time` hours further and continues from the particle dump of the previous
+    one through `parent_calc_folder`, all the segments but the last dump their particles at the end
+    (`particle_dump` 2) whatever the command says. Once a segment has run, the next ones are sized from its
+    wall-clock time per simulated hour so that they fill `walltime_fraction` of `max_wallclock_seconds`.
+    """
+
+    @classmethod
+    def define(cls, spec):
+        """Specify inputs and outputs."""
+        super().define(spec)
+
+        spec.expose_inputs(
+            FlexpartCosmoCalculation,
+            namespace="cosmo",
+            exclude=("parent_calc_folder",),
+            namespace_options={"required": False, "populate_defaults": False,
+                               "help": "Inputs of the segments, for a COSMO simulation."},
+        )
+        spec.expose_inputs(
+            FlexpartIfsCalculation,
+            namespace="ifs",
+            exclude=("parent_calc_folder",),
+            namespace_options={"required": False, "populate_defaults": False,
+                               "help": "Inputs of the segments, for an IFS simulation."},
+        )
+        spec.input(
+            "segment_time",
+            valid_type=orm.Int,
+            default=lambda: orm.Int(24),
+            help="Integration time of the first segment, in hours.",
+        )
+        spec.input(
+            "walltime_fraction",
+            valid_type=orm.Float,
+            default=lambda: orm.Float(0.8),
+            help="Fraction of the walltime filled by the next segments, estimated from the previous one. "
+                 "Zero keeps `segment_time` for all the segments.",
+        )
+
+        spec.outputs.dynamic = True
+        spec.output("remote_folder", valid_type=orm.RemoteData,
+                    help="Working directory of the last segment, with the final particle dump.")
+
+        #exit codes
+        spec.exit_code(400, 'ERROR_CALCULATION_FAILED',
+                       'the previous calculation did not finish successfully')
+        spec.exit_code(401, 'ERROR_INVALID_INPUTS',
+                       'exactly one of the `cosmo` and `ifs` namespaces must be given')
+
+        spec.outline(
+            cls.setup,
+            engine.while_(cls.should_run_segment)(
+                cls.run_segment,
+                cls.inspect_segment,
+            ),
+            cls.results,
+        )
+
+    def setup(self):
+        """Select the calculation and read the total integration time."""
+        namespaces = [name for name in ("cosmo", "ifs") if name in self.inputs]
+        if len(namespaces) != 1:
+            return self.exit_codes.ERROR_INVALID_INPUTS
+
+        self.ctx.namespace = namespaces[0]
+        self.ctx.calculation_class = (FlexpartCosmoCalculation if self.ctx.namespace == "cosmo"
+                                      else FlexpartIfsCalculation)
+        command = self.inputs[self.ctx.namespace].model_settings.command.get_dict()
+        self.ctx.total_time = int(command["age_class"])
+        self.ctx.integrated_time = 0
+        self.ctx.segment_time = self.inputs.segment_time.value * 3600
+        self.ctx.calculations = []
+        return None
+
+    def should_run_segment(self):
+        """run segments until the total integration time is reached"""
+        return self.ctx.integrated_time < self.ctx.total_time
+
+    def run_segment(self):
+        """Run the next segment, continuing from the particle dump of the previous one."""
+        inputs = self.exposed_inputs(self.ctx.calculation_class, namespace=self.ctx.namespace)
+        end = min(self.ctx.integrated_time + self.ctx.segment_time, self.ctx.total_time)
+
+        # changes in the command file
+        new_dict = inputs.model_settings.command.get_dict()
+        new_dict["age_class"] = end
+        if end < self.ctx.total_time:
+            # the next segment needs all the particles alive at the end of this one, the dump
+            # mode of the command (e.g. 4, when leaving the domain) only applies to the last segment
+            new_dict["particle_dump"] = 2
+        if self.ctx.calculations:
+            new_dict["dumped_particle_data"] = True
+            inputs.parent_calc_folder = self.ctx.calculations[-1].outputs.remote_folder
+            self.report(f"starting from: {inputs.parent_calc_folder}")
+        inputs.model_settings = {**inputs.model_settings, "command": orm.Dict(dict=new_dict)}
+        inputs.metadata = {**inputs.get("metadata", {}), "call_link_label": f"segment_{len(self.ctx.calculations)}"}
+
+        self.report(f"running segment {len(self.ctx.calculations)}: "
+                    f"{self.ctx.integrated_time // 3600} h to {end // 3600} h")
+        self.ctx.segment_end = end
+
+        # Ask the workflow to continue when the results are ready and store them in the context
+        running = self.submit(self.ctx.calculation_class, **inputs)
+        return engine.ToContext(calculations=engine.append_(running))
+
+    def inspect_segment(self):
+        """Check the segment and size the next one from its performance."""
+        calculation = self.ctx.calculations[-1]
+        if not calculation.is_finished_ok:
+            self.report('ERROR calculation did not finish ok')
+            return self.exit_codes.ERROR_CALCULATION_FAILED
+        segment_hours = (self.ctx.segment_end - self.ctx.integrated_time) / 3600
+        self.ctx.integrated_time = self.ctx.segment_end
+
+        fraction = self.inputs.walltime_fraction.value
+        if fraction > 0 and "performance" in calculation.outputs:
+            # from the length of the segment, the log of a continuation also counts the hours before it
+            wallclock = calculation.outputs.performance.get("wallclock_seconds")
+            per_hour = wallclock / segment_hours if wallclock else None
+            if per_hour:
+                walltime = calculation.get_option("max_wallclock_seconds")
+                hours = max(1, math.floor(fraction * walltime / per_hour))
+                self.ctx.segment_time = hours * 3600
+                self.report(f"next segments: {hours} h ({per_hour:.1f} s per simulated hour)")
+        return None
+
+    def results(self):
+        """Process results."""
+        for indx, calculation in enumerate(self.ctx.calculations):
+            self.out(f"calculation_{indx}_output_file", calculation.outputs.output_file)
+        self.out("remote_folder", self.ctx.calculations[-1].outputs.remote_folder)
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 """pytest fixtures for simplified testing."""
 from __future__ import absolute_import
+import struct
+
 import pytest
 pytest_plugins = ['aiida.manage.tests.pytest_fixtures']
 
@@ -15,3 +17,70 @@ def flexpart_code(aiida_local_code_factory):
     """Get a flexpart code.
     """
     return aiida_local_code_factory(executable='diff', entry_point='flexpart')
+
+
+@pytest.fixture
+def fortran_file():
+    """Write a Fortran unformatted sequential file, the records are bytes or lists of (struct format, values)."""
+
+    def write(path, records, byteorder='>'):
+        with open(path, 'wb') as handle:
+            for record in records:
+                if not isinstance(record, bytes):
+                    record = b''.join(struct.pack(byteorder + fmt, *values) for fmt, values in record)
+                marker = struct.pack(f'{byteorder}i', len(record))
+                handle.write(marker + record + marker)
+        return path
+
+    return write
+
+
+@pytest.fixture
+def header_file(fortran_file):  # pylint: disable=redefined-outer-name
+    """Write a FLEXPART header with the records of `writeheader`, the keyword arguments change the defaults.
+
+    Returns the path and the dictionary of the values written, the orography `oro` is (latitude, longitude).
+    """
+
+    def write(path, byteorder='>', **kwargs):
+        values = {
+            'ibdate': 20210301, 'ibtime': 120000, 'version': 'FLEXPART V10.4',
+            'loutstep': -10800, 'loutaver': -10800, 'loutsample': -900,
+            'outlon0': -10., 'outlat0': 40., 'numxgrid': 5, 'numygrid': 4, 'dxout': .5, 'dyout': .25,
+            'outheight': [100., 500.], 'species': ['CO2', 'CH4'], 'numpoint': 3,
+            'switches': [1, 0, 1, 1, 2], 'lage': [86400, 172800],
+        }
+        values.update(kwargs)
+        numxgrid, numygrid = values['numxgrid'], values['numygrid']
+        values.setdefault('oro', [[100. * ix + jy for ix in range(numxgrid)] for jy in range(numygrid)])
+        n_species, outheight = len(values['species']), values['outheight']
+
+        records = [
+            [('2i', (values['ibdate'], values['ibtime'])), ('29s', (values['version'].encode(),))],
+            [('3i', (values['loutstep'], values['loutaver'], values['loutsample']))],
+            [('2f', (values['outlon0'], values['outlat0'])), ('2i', (numxgrid, numygrid)),
+             ('2f', (values['dxout'], values['dyout']))],
+            [('i', (len(outheight),)), (f'{len(outheight)}f', outheight)],
+            [('2i', (values['ibdate'], values['ibtime']))],
+            [('2i', (3 * n_species, values['numpoint']))],
+        ]
+        for name in values['species']:
+            records += [[('i', (1,)), ('10s', (f'WD_{name}'.encode(),))],
+                        [('i', (1,)), ('10s', (f'DD_{name}'.encode(),))],
+                        [('i', (len(outheight),)), ('10s', (name.encode(),))]]
+        records.append([('i', (values['numpoint'],))])
+        for point in range(values['numpoint']):
+            records += [
+                [('2i', (-3600 * (point + 1), -3600 * point)), ('h', (1,))],
+                [('6f', (8. + point, 47., 8.5 + point, 47.5, 10., 50.))],
+                [('2i', (1000 * (point + 1), 1))],
+                [('45s', (f'SITE{point}'.encode(),))],
+            ]
+            records += [[('f', (point + species,))] for species in range(n_species) for _ in range(3)]
+        records.append([('5i', values['switches'])])
+        records.append([('i', (len(values['lage']),)), (f'{len(values["lage"])}i', values['lage'])])
+        # one record per longitude
+        records += [[(f'{numygrid}f', [row[ix] for row in values['oro']])] for ix in range(numxgrid)]
+        return fortran_file(path, records, byteorder), values
+
+    return write
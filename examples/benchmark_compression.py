@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark the bit-rounding compression of footprints on synthetic data.
+
+Prints, for each bound of the relative error, the number of mantissa bits kept,
+the size reduction with respect to the lossless compressed file and the largest
+relative error of the reconstructed values.
+
+Usage: ./benchmark_compression.py [--compression zstd]
+"""
+import click
+
+from aiida_flexpart.footprints.compression import benchmark
+
+
+@click.command()
+@click.option('--compression', default='zlib', type=click.Choice(['zlib', 'zstd']))
+def cli(compression):
+    """Run the benchmark."""
+    click.echo(f"{'bound':>8} {'bits':>5} {'ratio':>7} {'max error':>10}")
+    for result in benchmark(compression=compression):
+        click.echo(f"{result['rel_error']:8.0e} {result['keepbits']:5d} "
+                   f"{result['size_ratio']:7.2f} {result['max_rel_error']:10.2e}")
+
+
+if __name__ == '__main__':
+    cli()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Tests of the aggregation of footprints per site and month."""
+import numpy
+import netCDF4
+import pytest
+import yaml
+from aiida.common import folders
+from aiida.engine.utils import instantiate_process
+from aiida.manage import get_manager
+from aiida.plugins import CalculationFactory, DataFactory
+
+from aiida_flexpart.footprints.aggregation import aggregate, aggregate_groups
+
+AggregateFootprintsCalculation = CalculationFactory('footprints.aggregate')
+NetCDF = DataFactory('netcdf.data')
+
+
+def write_footprints(path, values):
+    """Footprint file with the values (nageclass, pointspec, time, height, latitude, longitude)."""
+    with netCDF4.Dataset(str(path), mode='w') as nc_file:
+        for name, size in zip(('nageclass', 'pointspec', 'time', 'height', 'latitude', 'longitude'), values.shape):
+            nc_file.createDimension(name, size)
+        for name in ('height', 'latitude', 'longitude'):
+            nc_file.createVariable(name, 'f4', (name,))[:] = numpy.arange(len(nc_file.dimensions[name]))
+        variable = nc_file.createVariable('spec001_mr', 'f4', tuple(nc_file.dimensions))
+        variable.units = 's m3 kg-1'
+        variable[:] = values
+    return path
+
+
+def test_aggregate_groups(tmp_path):
+    """The statistics of each group are those of the time-integrated footprints of its release points."""
+    rng = numpy.random.default_rng(0)
+    values = {name: rng.random((1, 2, 3, 1, 4, 5)).astype('f4') for name in ('a', 'b', 'c')}
+    paths = {name: write_footprints(tmp_path / f'{name}.nc', value) for name, value in values.items()}
+    # footprints whose month is unknown are grouped by site only
+    summary = aggregate_groups({'SITE': [paths['a']], 'SITE_202103': [paths['b'], paths['c']]},
+                               out_dir=tmp_path, max_workers=2)
+    assert {group: result['n_samples'] for group, result in summary.items()} == {'SITE': 2, 'SITE_202103': 4}
+
+    samples = numpy.concatenate([values['b'].sum(axis=2)[0], values['c'].sum(axis=2)[0]])
+    with netCDF4.Dataset(summary['SITE_202103']['path']) as nc_file:
+        numpy.testing.assert_allclose(nc_file.variables['spec001_mr_mean'][0], samples.mean(axis=0), rtol=1e-6)
+        numpy.testing.assert_allclose(nc_file.variables['spec001_mr_variance'][0], samples.var(axis=0, ddof=1),
+                                      rtol=1e-5)
+        numpy.testing.assert_allclose(nc_file.variables['spec001_mr_max'][0], samples.max(axis=0), rtol=1e-6)
+        assert nc_file.variables['spec001_mr_variance'].units == '(s m3 kg-1)2'
+
+
+def test_aggregate_empty():
+    """Aggregating no footprints is an error."""
+    with pytest.raises(ValueError):
+        aggregate([])
+
+
+def test_prepare_for_submission(aiida_localhost, aiida_local_code_factory, tmp_path):
+    """The footprints are grouped by site and month, by site only when the month is unknown."""
+    code = aiida_local_code_factory(executable='python', entry_point='footprints.aggregate')
+    remotes = {}
+    for key, filename in (('SITEA_1', 'grid_time_20210301.nc'), ('SITEA_2', 'grid_time_20210315.nc'),
+                          ('SITEA_3', 'footprints.nc'), ('SITEB_1', 'grid_time_20210401.nc')):
+        remotes[key] = NetCDF(filename, remote_path=f'/scratch/{key}/{filename}', computer=aiida_localhost,
+                              g_att={}, nc_dimensions={})
+    runner = get_manager().get_runner()
+    process = instantiate_process(runner, AggregateFootprintsCalculation, code=code, remotes=remotes)
+
+    folder = folders.Folder(str(tmp_path))
+    calcinfo = process.prepare_for_submission(folder)
+    with folder.open('aggregate.yaml', 'r') as handle:
+        config = yaml.safe_load(handle)
+
+    assert config['groups'] == {
+        'SITEA': ['/scratch/SITEA_3/footprints.nc'],
+        'SITEA_202103': ['/scratch/SITEA_1/grid_time_20210301.nc', '/scratch/SITEA_2/grid_time_20210315.nc'],
+        'SITEB_202104': ['/scratch/SITEB_1/grid_time_20210401.nc'],
+    }
+    assert sorted(calcinfo.retrieve_list) == ['SITEA.nc', 'SITEA_202103.nc', 'SITEB_202104.nc', 'aggregates.yaml',
+                                              'aiida.out']
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Tests of the collection of sensitivities."""
+from concurrent import futures
+
+from aiida_flexpart.calculations.collect_sens import get_default_params, make_params
+
+
+def get_paths(index):
+    """Stashed folders with their own dates, site and paths."""
+    return {f'2021_{index % 12 + 1:02d}_{day:02d}SITE{index}': f'/stash/{index}/{day}' for day in range(1, 4)}
+
+
+def test_default_params_are_copies():
+    """Modifying the defaults, nested dictionaries included, does not change them for the next caller."""
+    params = get_default_params()
+    params['globals']['met_model'] = 'modified'
+    params['path'] = ['modified']
+    assert get_default_params()['globals']['met_model'] != 'modified'
+    assert get_default_params()['path'] != ['modified']
+
+
+def test_make_params():
+    """The inputs of a submission override the defaults."""
+    params = make_params(get_paths(1), 'cosmo7', 'EUROPE', True, 4)
+    assert params['rel.com'] == ['SITE1']
+    assert params['path'] == params['bs.path'] == ['/stash/1/1', '/stash/1/2', '/stash/1/3']
+    assert params['days'] == ['2021-02-01', '2021-02-02', '2021-02-03']
+    assert (params['domain.str'], params['nest'], params['nn.cores']) == ('EUROPE', True, 4)
+    assert params['globals']['met_model'] == 'cosmo7'
+    assert params['globals']['model_version'] == 'FLEXPART COSMO'
+    assert make_params(get_paths(2), 'IFS_GL_05', 'EUROPE', False, 1)['globals']['model_version'] == 'FLEXPART IFS'
+
+
+def test_parallel_submissions():
+    """The params of submissions prepared concurrently only hold their own inputs."""
+    n_submissions = 64
+
+    def prepare(index):
+        return make_params(get_paths(index), 'cosmo7' if index % 2 else 'IFS_GL_05', 'EUROPE', bool(index % 2), 1)
+
+    with futures.ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(prepare, range(n_submissions)))
+
+    for index, params in enumerate(results):
+        assert params['rel.com'] == [f'SITE{index}']
+        assert sorted(params['path']) == [f'/stash/{index}/{day}' for day in range(1, 4)]
+        assert sorted(params['days']) == [f'2021-{index % 12 + 1:02d}-{day:02d}' for day in range(1, 4)]
+        assert params['nest'] == bool(index % 2)
+        assert params['globals']['met_model'] == ('cosmo7' if index % 2 else 'IFS_GL_05')
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Tests of the reader of the native binary gridded FLEXPART output."""
+import dataclasses
+
+import numpy
+import netCDF4
+import pytest
+
+from aiida_flexpart.readers.grid import GridFile, decode_sparse, find_grid_files, to_netcdf
+
+
+def encode_sparse(dense, offset=0):
+    """Runs of consecutive non-zero cells, as written by FLEXPART."""
+    flat = dense.ravel()
+    cells = numpy.flatnonzero(flat)
+    new_run = numpy.r_[True, numpy.diff(cells) > 1]
+    signs = numpy.where((numpy.cumsum(new_run) - 1) % 2, -1., 1.)
+    return cells[new_run] + offset, (flat[cells] * signs).astype('f4')
+
+
+def sparse_records(dense, offset=0):
+    """The four records of a field."""
+    indices, values = encode_sparse(dense, offset)
+    return [[('i', (indices.size,))], [(f'{indices.size}i', indices.tolist())],
+            [('i', (values.size,))], [(f'{values.size}f', values.tolist())]]
+
+
+@pytest.fixture
+def grid_run(header_file, fortran_file, tmp_path):
+    """Run directory of a backward run with a header and two output times, returns the 3-d fields."""
+    _, values = header_file(tmp_path / 'header')
+    shape = (len(values['outheight']), values['numygrid'], values['numxgrid'])
+    offset = values['numxgrid'] * values['numygrid']
+    rng = numpy.random.default_rng(0)
+    fields = {}
+    for itime in (-10800, -21600):
+        # nageclass, pointspec, height, latitude, longitude
+        field = rng.uniform(.5, 2., (len(values['lage']), values['numpoint']) + shape).astype('f4')
+        field[rng.random(field.shape) < .6] = 0.
+        records = [[('i', (itime,))]]
+        for point in range(values['numpoint']):
+            for age in range(len(values['lage'])):
+                # no deposition in backward runs
+                records += [[('i', (0,))], b'', [('i', (0,))], b''] * 2
+                records += sparse_records(field[age, point], offset)
+        fortran_file(tmp_path / f'grid_time_2021030{1 if itime == -10800 else 2}090000_001', records)
+        fields[itime] = field
+    return tmp_path, fields
+
+
+def test_decode_sparse():
+    """Runs are split where the sign of the values flips."""
+    dense = numpy.array([0., 1., 2., 0., 3., 0., 0., 4., 5.], dtype='f4')
+    indices, values = encode_sparse(dense, offset=10)
+    assert indices.tolist() == [11, 14, 17]
+    assert values.tolist() == [1., 2., -3., 4., 5.]
+    numpy.testing.assert_array_equal(decode_sparse(indices, values, dense.size, offset=10), dense)
+
+
+def test_grid_file(grid_run):
+    """The fields of a synthetic grid file are decoded dense and sparse."""
+    directory, fields = grid_run
+    grid_file = GridFile(directory / 'grid_time_20210301090000_001')
+    field = fields[-10800]
+
+    assert grid_file.itime == -10800
+    assert grid_file.time.isoformat() == '2021-03-01T09:00:00'
+    numpy.testing.assert_array_equal(grid_file.read(), field)
+    assert not grid_file.read('wet').any()
+    assert grid_file.read('dry').shape == field.shape[:2] + field.shape[3:]
+
+    rows = field.reshape(field.shape[0] * field.shape[1], -1)
+    numpy.testing.assert_array_equal(grid_file.read_sparse().toarray(), rows)
+
+
+def test_grid_file_records(grid_run):
+    """A file that does not match the release points of the header is an error."""
+    directory, _ = grid_run
+    path = directory / 'grid_time_20210301090000_001'
+    header = dataclasses.replace(GridFile(path).header, maxpointspec_act=2)
+    with pytest.raises(ValueError):
+        GridFile(path, header)
+
+
+def test_to_netcdf(grid_run):
+    """The output times are sorted and the 3-d fields written like the NetCDF output of FLEXPART."""
+    directory, fields = grid_run
+    (key, paths), = find_grid_files(directory).items()
+    assert key == ('grid_time_', 1)
+
+    out_path = directory / 'grid_time.nc'
+    assert to_netcdf(paths, out_path) == 2
+    with netCDF4.Dataset(str(out_path)) as nc_file:
+        assert nc_file.variables['time'][:].tolist() == [-21600, -10800]
+        numpy.testing.assert_array_equal(nc_file.variables['spec001_mr'][:, :, 0], fields[-21600])
+        numpy.testing.assert_array_equal(nc_file.variables['spec001_mr'][:, :, 1], fields[-10800])
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Tests of the reader of the binary FLEXPART header."""
+import datetime
+
+import numpy
+import pytest
+
+from aiida_flexpart.readers.header import parse_header, read_header
+
+
+@pytest.mark.parametrize('byteorder', ['>', '<'])
+def test_parse_header(header_file, tmp_path, byteorder):
+    """The records written by `writeheader` are decoded, the orography is (latitude, longitude)."""
+    path, values = header_file(tmp_path / 'header', byteorder=byteorder)
+    header = read_header(path)
+
+    assert header.start == datetime.datetime(2021, 3, 1, 12)
+    assert header.version == values['version']
+    assert (header.loutstep, header.loutaver, header.loutsample) == (-10800, -10800, -900)
+    assert header.outgrid == {
+        'longitude_of_output_grid': -10.,
+        'latitude_of_output_grid': 40.,
+        'number_of_grid_points_x': 5,
+        'number_of_grid_points_y': 4,
+        'grid_distance_x': .5,
+        'grid_distance_y': .25,
+        'heights_of_levels': [100., 500.],
+    }
+    assert header.species == ['CO2', 'CH4']
+    assert header.maxpointspec_act == 3
+    assert header.releases['start'].tolist() == [-3600, -7200, -10800]
+    assert header.releases['kindz'].tolist() == [1, 1, 1]
+    assert header.releases['lon1'].tolist() == [8., 9., 10.]
+    assert header.releases['npart'].tolist() == [1000, 2000, 3000]
+    assert header.releases['name'].tolist() == ['SITE0', 'SITE1', 'SITE2']
+    assert header.releases['xmass'].tolist() == [[0., 1.], [1., 2.], [2., 3.]]
+    assert header.switches == {'method': 1, 'lsubgrid': 0, 'lconvection': 1, 'ind_source': 1, 'ind_receptor': 2}
+    assert header.lage.tolist() == [86400, 172800]
+    assert header.oro.shape == (4, 5)
+    numpy.testing.assert_array_equal(header.oro, values['oro'])
+
+
+def test_parse_header_missing_orography(header_file, tmp_path):
+    """A header cut within the orography records is an error."""
+    path, _ = header_file(tmp_path / 'header')
+    buffer = numpy.fromfile(path, dtype='u1')
+    # each orography record is 4 values and 2 length markers
+    with pytest.raises(ValueError):
+        parse_header(buffer[:-2 * (4 * 4 + 8)])
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""Tests of the scheduling of the inversion chunks."""
+import pytest
+
+from aiida_flexpart.workflows.inversion_workflow import next_wave
+
+
+def run_waves(chains, limit):
+    """Chunks of each wave, as submitted by the `run_inv`/`inspect_inv` loop of the workflow."""
+    chains = [list(chain) for chain in chains]
+    waves = []
+    while any(chains):
+        waves.append([chains[indx].pop(0) for indx in next_wave(chains, limit)])
+    return waves
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3])
+def test_more_chunks_than_limit(limit):
+    """Independent chunks run in waves of at most `limit` chunks, each chunk once."""
+    chains = [[month] for month in range(7)]
+    waves = run_waves(chains, limit)
+    assert all(len(wave) <= limit for wave in waves)
+    assert len(waves) == -(-7 // limit)
+    assert sorted(chunk for wave in waves for chunk in wave) == list(range(7))
+
+
+def test_sequences():
+    """The chunks of a sequence run in order in successive waves, the longest sequences first."""
+    chains = [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11]]
+    waves = run_waves(chains, 2)
+    assert len(waves) == 6
+    assert all(len(wave) == 2 for wave in waves)
+    for chain in chains:
+        order = [wave_index for wave_index, wave in enumerate(waves) for chunk in wave if chunk in chain]
+        assert order == sorted(set(order)) and len(order) == 4
+
+
+def test_no_limit():
+    """Without limit, all the sequences with chunks left are in the wave."""
+    assert next_wave([[1], [], [2, 3]], 0) == [0, 2]
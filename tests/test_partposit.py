@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""Tests of the reader of the FLEXPART particle dumps."""
+import numpy
+import pytest
+
+from aiida_flexpart.readers.partposit import END_OF_PARTICLES, PartpositFile, compact, write_partposit
+
+ITIME = 86400
+NSPEC = 3
+
+
+def particle(index):
+    """Values of the record of a particle, the positions and masses depend on its index."""
+    return {
+        'npoint': index % 4 + 1,
+        'xlon': -10. + index,
+        'ylat': 40. + index / 2,
+        'ztra': 100. * index,
+        'itramem': ITIME - 3600 * index,
+        'topo': 500.,
+        'pv': 1.,
+        'qv': .01,
+        'rho': 1.2,
+        'hmix': 1000.,
+        'tr': 0.,
+        'tt': 280.,
+        'xmass': [index * .5, 1., 0.],
+    }
+
+
+def particle_record(values):
+    """Record of a particle, as written by `partoutput`."""
+    return [('i3fi7f', (values['npoint'], values['xlon'], values['ylat'], values['ztra'], values['itramem'],
+                        values['topo'], values['pv'], values['qv'], values['rho'], values['hmix'],
+                        values['tr'], values['tt'])),
+            (f'{NSPEC}f', values['xmass'])]
+
+
+@pytest.fixture
+def dump_file(fortran_file, tmp_path):
+    """Big-endian dump of `n_particles` particles with three species."""
+
+    def write(n_particles=10, name='partposit_inst'):
+        terminator = dict(particle(0), npoint=END_OF_PARTICLES, itramem=END_OF_PARTICLES,
+                          xmass=[-9999.9] * NSPEC)
+        records = [[('i', (ITIME,))]]
+        records += [particle_record(particle(index)) for index in range(n_particles)]
+        records.append(particle_record(terminator))
+        return fortran_file(tmp_path / name, records, '>')
+
+    return write
+
+
+def test_partposit_file(dump_file):
+    """The fields of the particles are read without the terminating record."""
+    dump = PartpositFile(dump_file())
+    assert dump.byteorder == '>'
+    assert dump.itime == ITIME
+    assert dump.nspec == NSPEC
+    assert len(dump) == 10
+    assert dump.validate()
+
+    assert dump.release_points.tolist() == [index % 4 + 1 for index in range(10)]
+    assert dump['itramem'].tolist() == [ITIME - 3600 * index for index in range(10)]
+    lon, lat, height = dump.positions
+    assert all(numpy.shares_memory(field, dump.particles) for field in (lon, lat, height))
+    numpy.testing.assert_allclose([lon[3], lat[3], height[3]], [-7., 41.5, 300.])
+    assert dump.masses.shape == (10, NSPEC)
+    numpy.testing.assert_allclose(dump.masses[:, 0], numpy.arange(10) * .5)
+
+
+def test_iter_chunks(dump_file):
+    """The chunks are views of the dump covering all the particles."""
+    dump = PartpositFile(dump_file())
+    chunks = list(dump.iter_chunks(chunk_size=4))
+    assert [chunk.size for chunk in chunks] == [4, 4, 2]
+    numpy.testing.assert_array_equal(numpy.concatenate(chunks), dump.particles)
+
+
+def test_validate(dump_file):
+    """A record marker that does not hold the record length is detected."""
+    path = dump_file()
+    dump = PartpositFile(path, mode='r+')
+    dump.particles[5]['tail'] = 0
+    dump.particles.flush()
+    assert not PartpositFile(path).validate()
+
+
+def test_not_a_dump(tmp_path):
+    """Files that are not particle dumps are rejected."""
+    path = tmp_path / 'partposit_inst'
+    path.write_bytes(b'not a particle dump')
+    with pytest.raises(ValueError):
+        PartpositFile(path)
+
+
+@pytest.mark.parametrize('byteorder', ['<', '>'])
+def test_write_partposit(dump_file, tmp_path, byteorder):
+    """Writing the particles, at once or by chunks, round-trips."""
+    dump = PartpositFile(dump_file())
+    for particles in (dump.particles, dump.iter_chunks(chunk_size=3)):
+        path = tmp_path / 'copy'
+        assert write_partposit(path, dump.itime, particles, byteorder) == 10
+        copy = PartpositFile(path)
+        assert copy.byteorder == byteorder
+        assert copy.itime == ITIME
+        assert copy.validate()
+        for name in dump.dtype.names:
+            numpy.testing.assert_array_equal(copy[name], dump[name])
+
+
+def test_write_partposit_without_particles(tmp_path):
+    """A dump without particles needs the number of species."""
+    with pytest.raises(ValueError):
+        write_partposit(tmp_path / 'empty', ITIME, [])
+    assert write_partposit(tmp_path / 'empty', ITIME, [], nspec=NSPEC) == 0
+    empty = PartpositFile(tmp_path / 'empty')
+    assert (len(empty), empty.nspec) == (0, NSPEC)
+
+
+def test_compact(dump_file, tmp_path):
+    """The particles that are too light, too old or in the region are dropped."""
+    path = dump_file()
+    out_path = tmp_path / 'compacted'
+    summary = compact(path, out_path, min_mass=1.5, max_age=6 * 3600, region=[-8.5, -6.5, 40., 50.],
+                      chunk_size=4)
+    # masses 1 + index / 2, ages 3600 * index, longitudes -10 + index
+    kept = [4, 5, 6]
+    assert summary['itime'] == ITIME
+    assert (summary['n_particles_in'], summary['n_particles_out']) == (10, len(kept))
+    assert summary['size_out'] < summary['size_in']
+
+    compacted = PartpositFile(out_path)
+    assert compacted.byteorder == '>'
+    assert compacted.validate()
+    numpy.testing.assert_allclose(compacted['xlon'], [-10. + index for index in kept])
+
+    summary = compact(path, out_path, region=[-8.5, -6.5, 40., 50.], keep='inside')
+    assert summary['n_particles_out'] == 2
+
+
+@pytest.mark.parametrize('n_particles, min_mass', [(10, 100.), (0, 0.)])
+def test_compact_empty(dump_file, tmp_path, n_particles, min_mass):
+    """Compacting to no particles, from a dump with or without particles, writes a valid dump."""
+    path = dump_file(n_particles)
+    summary = compact(path, tmp_path / 'compacted', min_mass=min_mass)
+    assert summary['n_particles_out'] == 0
+    compacted = PartpositFile(tmp_path / 'compacted')
+    assert (len(compacted), compacted.nspec, compacted.itime) == (0, NSPEC, ITIME)
+    assert compacted.validate()